@@ -6,22 +6,51 @@ from StepDaddyLiveHD.components import navbar, card
 from StepDaddyLiveHD.step_daddy import Channel
 
 
+PAGE_SIZE = 48
+
+
 class State(rx.State):
+    # Only the page on screen is kept in the session, however many channels there are.
     channels: List[Channel] = []
+    offset: int = 0
+    total: int = 0
+    loaded: bool = False
     search_query: str = ""
 
     @rx.var
-    def filtered_channels(self) -> List[Channel]:
-        if not self.search_query:
-            return self.channels
-        return [ch for ch in self.channels if self.search_query.lower() in ch.name.lower()]
+    def has_more(self) -> bool:
+        return self.offset + len(self.channels) < self.total
+
+    @rx.var
+    def has_previous(self) -> bool:
+        return self.offset > 0
+
+    @rx.var
+    def page_label(self) -> str:
+        if not self.channels:
+            return ""
+        return f"{self.offset + 1}–{self.offset + len(self.channels)} of {self.total}"
+
+    def _load_page(self, offset: int):
+        self.channels, self.total = backend.get_channels_page(self.search_query, offset, PAGE_SIZE)
+        self.offset = offset
 
     async def on_load(self):
-        self.channels = backend.get_channels()
+        self.loaded = bool(backend.get_channels())
+        self._load_page(0)
 
     @rx.event
     def set_search_query(self, value: str):
         self.search_query = value
+        self._load_page(0)
+
+    @rx.event
+    def next_page(self):
+        self._load_page(self.offset + PAGE_SIZE)
+
+    @rx.event
+    def previous_page(self):
+        self._load_page(max(self.offset - PAGE_SIZE, 0))
 
 
 @rx.page("/", on_load=State.on_load)
@@ -33,7 +62,7 @@ def index() -> rx.Component:
                     rx.input.slot(
                         rx.icon("search"),
                     ),
-                    placeholder="Search channels...",
+                    placeholder="Search channels or #tags...",
                     on_change=State.set_search_query,
                     value=State.search_query,
                     width="100%",
@@ -44,18 +73,44 @@ def index() -> rx.Component:
         ),
         rx.center(
             rx.cond(
-                State.channels,
-                rx.grid(
-                    rx.foreach(
-                        State.filtered_channels,
-                        lambda channel: card(channel),
+                State.loaded,
+                rx.vstack(
+                    rx.grid(
+                        rx.foreach(
+                            State.channels,
+                            lambda channel: card(channel),
+                        ),
+                        grid_template_columns="repeat(auto-fill, minmax(250px, 1fr))",
+                        spacing=rx.breakpoints(
+                            initial="4",
+                            sm="6",
+                            lg="9"
+                        ),
+                        width="100%",
                     ),
-                    grid_template_columns="repeat(auto-fill, minmax(250px, 1fr))",
-                    spacing=rx.breakpoints(
-                        initial="4",
-                        sm="6",
-                        lg="9"
+                    rx.hstack(
+                        rx.button(
+                            rx.icon("chevron-left"),
+                            "Previous",
+                            on_click=State.previous_page,
+                            disabled=~State.has_previous,
+                            variant="surface",
+                            size="3",
+                        ),
+                        rx.text(State.page_label, color_scheme="gray"),
+                        rx.button(
+                            "Next",
+                            rx.icon("chevron-right"),
+                            on_click=State.next_page,
+                            disabled=~State.has_more,
+                            variant="surface",
+                            size="3",
+                        ),
+                        align="center",
+                        spacing="4",
                     ),
+                    align="center",
+                    spacing="6",
                     width="100%",
                 ),
                 rx.center(
@@ -78,3 +133,5 @@ app = rx.App(
 )
 
 app.register_lifespan_task(backend.update_channels)
+app.register_lifespan_task(backend.update_schedule)
+app.register_lifespan_task(backend.prewarm_streams)
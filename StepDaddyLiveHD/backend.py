@@ -1,24 +1,125 @@
-import os
 import asyncio
+import json
 import secrets
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator
 import httpx
 from StepDaddyLiveHD.step_daddy import StepDaddy, Channel
 from StepDaddyLiveHD import secret_manager
-from fastapi import Response, status, FastAPI, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
-from .utils import urlsafe_base64_decode
+from fastapi import Request, Response, status, FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, PlainTextResponse
+from .http_pool import client_stats, create_client, host_limiter
+from .logo_cache import VARIANTS as LOGO_VARIANTS, LogoCache
+from .metrics import PROXIED_BYTES, STAGE_SECONDS, Counter, Gauge, count_response, render as render_metrics, viewers
+from .relay import RelayManager
+from .cache import SingleFlight
+from .schedule_store import EMPTY_SCHEDULE, UTC, ScheduleSnapshot, channel_ids_between, parse_schedule
+from .segment_cache import SegmentCache
+from .shared_state import shared_state
+from .spool import SegmentSpool
+from .utils import cache_stats, urlsafe_base64_decode
+from rxconfig import config
 
 
 fastapi_app = FastAPI()
 step_daddy = StepDaddy()
-client = httpx.AsyncClient(http2=True, timeout=None, verify=False)
+client = create_client()
+
+
+@asynccontextmanager
+async def _fetch_segment(url: str, headers: dict | None = None):
+    # Segments are compressed video already; asking for identity keeps upstream bytes and lengths as they are.
+    headers = {"Accept-Encoding": "identity", **(headers or {})}
+    async with host_limiter.slot(url):
+        try:
+            async with client.stream("GET", url, headers=headers) as response:
+                count_response(url, response.status_code)
+                response.raise_for_status()
+                yield response
+        except httpx.TransportError:
+            count_response(url, "error")
+            raise
+
+
+segment_spool = None
+if config.segment_spool_dir:
+    segment_spool = SegmentSpool(
+        config.segment_spool_dir, slots=config.segment_spool_slots, max_bytes=config.segment_spool_mb * 1024 * 1024
+    )
+content_chunk_size = config.content_chunk_kb * 1024 or None
+segment_cache = SegmentCache(
+    _fetch_segment, max_bytes=config.segment_cache_mb * 1024 * 1024, spool=segment_spool, chunk_size=content_chunk_size
+)
+
+
+async def _download_segment(url: str) -> bytes | Path:
+    async with _fetch_segment(url) as response:
+        chunks = [chunk async for chunk in response.aiter_bytes(content_chunk_size)]
+    if segment_spool is not None:
+        return await segment_spool.put(url, chunks, "video/mp2t")
+    return b"".join(chunks)
+
+
+relay_manager = RelayManager(step_daddy, _download_segment, idle_timeout=config.relay_idle_timeout)
+
+
+async def _fetch_logo(url: str) -> bytes | None:
+    async with host_limiter.slot(url):
+        try:
+            response = await client.get(url, headers={"user-agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:137.0) Gecko/20100101 Firefox/137.0"})
+        except httpx.TransportError:
+            count_response(url, "error")
+            raise
+    count_response(url, response.status_code)
+    if response.status_code != 200:
+        return None
+    return response.content
+
+
+logo_cache = LogoCache(config.logo_cache_dir, max_bytes=config.logo_cache_mb * 1024 * 1024, fetch=_fetch_logo)
+
+
+def _client_address(request: Request) -> str:
+    # Behind Caddy every request comes from localhost; the original client is forwarded.
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else ""
+
+
+def _channel_label(channel_id: str | None) -> str:
+    # Only known channels become label values, so clients cannot grow the metrics without bound.
+    if channel_id and step_daddy.get_channel(channel_id) is not None:
+        return channel_id
+    return "unknown"
+
+
+async def _metered(chunks: AsyncIterator[bytes], channel: str):
+    size = 0
+    started = time.perf_counter()
+    try:
+        async for chunk in chunks:
+            if not size:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage="content")
+            size += len(chunk)
+            yield chunk
+    finally:
+        PROXIED_BYTES.inc(size, channel=channel)
 
 
 @fastapi_app.get("/stream/{channel_id}.m3u8")
-async def stream(channel_id: str):
+async def stream(channel_id: str, request: Request):
     try:
+        if config.relay_mode:
+            playlist = await relay_manager.playlist(channel_id)
+        else:
+            playlist = await step_daddy.stream(channel_id)
+        viewers.seen(channel_id, _client_address(request))
         return Response(
-            content=await step_daddy.stream(channel_id),
+            content=playlist,
             media_type="application/vnd.apple.mpegurl",
             headers={f"Content-Disposition": f"attachment; filename={channel_id}.m3u8"}
         )
@@ -31,8 +132,10 @@ async def stream(channel_id: str):
 @fastapi_app.get("/key/{url}/{host}")
 async def key(url: str, host: str):
     try:
+        with STAGE_SECONDS.time(stage="key"):
+            key = await step_daddy.key(url, host)
         return Response(
-            content=await step_daddy.key(url, host),
+            content=key,
             media_type="application/octet-stream",
             headers={"Content-Disposition": "attachment; filename=key"}
         )
@@ -40,25 +143,168 @@ async def key(url: str, host: str):
         return JSONResponse(content={"error": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _byte_range(header: str, length: int) -> tuple[int, int] | None:
+    """Parse a single ``bytes=`` range into ``(start, end)`` with ``end`` exclusive.
+
+    Returns None for ranges that should be ignored (other units, several
+    ranges, malformed values); ``start >= length`` means not satisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            return (max(length - suffix, 0), length) if suffix else (length, length)
+        start = int(first)
+        end = int(last) + 1 if last else length
+    except ValueError:
+        return None
+    if start >= length:
+        return length, length
+    if end <= start:
+        return None
+    return start, min(end, length)
+
+
 @fastapi_app.get("/content/{path}")
-async def content(path: str):
+async def content(path: str, request: Request, channel: str | None = None):
     try:
-        async def proxy_stream():
-            async with client.stream("GET", step_daddy.content_url(path), timeout=60) as response:
-                async for chunk in response.aiter_bytes(chunk_size=64 * 1024):
-                    yield chunk
-        return StreamingResponse(proxy_stream(), media_type="application/octet-stream")
+        url = step_daddy.content_url(path)
+        channel = _channel_label(channel)
+        spooled = segment_cache.spooled(url)
+        if spooled is not None:
+            # FileResponse answers range requests itself.
+            PROXIED_BYTES.inc(spooled.size, channel=channel)
+            return FileResponse(spooled.path, media_type=spooled.media_type)
+        segment = await segment_cache.get(url)
+        if segment.length is None:
+            # Without a known length ranges cannot be answered; send the whole segment as it arrives.
+            return StreamingResponse(_metered(segment.reader(), channel), media_type=segment.media_type)
+        headers = {"Accept-Ranges": "bytes"}
+        range_header = request.headers.get("range")
+        byte_range = _byte_range(range_header, segment.length) if range_header else None
+        if byte_range is None:
+            headers["Content-Length"] = str(segment.length)
+            return StreamingResponse(_metered(segment.reader(), channel), media_type=segment.media_type, headers=headers)
+        start, end = byte_range
+        if start >= segment.length:
+            headers["Content-Range"] = f"bytes */{segment.length}"
+            return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{segment.length}"
+        headers["Content-Length"] = str(end - start)
+        return StreamingResponse(
+            _metered(segment.reader(start, end), channel),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=segment.media_type,
+            headers=headers,
+        )
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=e.response.status_code)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@fastapi_app.get("/relay/{channel_id}/{sequence}.ts")
+async def relay_segment(channel_id: str, sequence: int):
+    segment = relay_manager.segment(channel_id, sequence)
+    if isinstance(segment, Path):
+        try:
+            stat = await asyncio.to_thread(segment.stat)
+        except FileNotFoundError:
+            # Evicted from the spool since the lookup.
+            segment = None
+        else:
+            PROXIED_BYTES.inc(stat.st_size, channel=channel_id)
+            return FileResponse(segment, media_type="video/mp2t", stat_result=stat)
+    if segment is None:
+        return JSONResponse(content={"error": "Segment not found"}, status_code=status.HTTP_404_NOT_FOUND)
+    PROXIED_BYTES.inc(len(segment), channel=channel_id)
+    return Response(content=segment, media_type="video/mp2t")
+
+
+@fastapi_app.get("/stats")
+async def stats():
+    return {
+        "crypto": cache_stats(),
+        "upstream": step_daddy.cache_stats(),
+        "segments": segment_cache.stats(),
+        "logos": logo_cache.stats(),
+        "relays": relay_manager.stats(),
+        "shared": shared_state.stats(),
+        "pools": {
+            "upstream": step_daddy.pool_stats(),
+            "content": client_stats(client),
+            "hosts": host_limiter.stats(),
+        },
+    }
+
+
+def _cache_counts() -> dict[str, tuple[int, int]]:
+    counts = {name: (cache["hits"], cache["misses"]) for name, cache in {**cache_stats(), **step_daddy.cache_stats()}.items()}
+    segments = segment_cache.stats()
+    # Requests that joined an in-flight download did not go upstream either.
+    counts["segments"] = (segments["hits"] + segments["coalesced"], segments["misses"])
+    return counts
+
+
+Counter(
+    "stepdaddy_cache_requests_total",
+    "Cache lookups by cache and result.",
+    ("cache", "result"),
+    function=lambda: {
+        (name, result): value
+        for name, (hits, misses) in _cache_counts().items()
+        for result, value in (("hit", hits), ("miss", misses))
+    },
+)
+Gauge(
+    "stepdaddy_cache_hit_ratio",
+    "Share of cache lookups served without going upstream.",
+    ("cache",),
+    function=lambda: {(name,): hits / (hits + misses) for name, (hits, misses) in _cache_counts().items() if hits + misses},
+)
+
+
+# Rendering walks dicts the event loop keeps updating, so it must not run in the thread pool.
+@fastapi_app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+_logo_prefetch: asyncio.Task | None = None
+
+
+def _prefetch_logos():
+    global _logo_prefetch
+    if config.logo_prefetch_concurrency <= 0 or (_logo_prefetch is not None and not _logo_prefetch.done()):
+        return
+    _logo_prefetch = asyncio.create_task(logo_cache.prefetch(step_daddy.logo_urls(), config.logo_prefetch_concurrency))
+
+
+# Seconds a worker stays leader without renewing; update_channels() renews well within it.
+LEADER_LEASE = 90
+
+
 async def update_channels():
+    refreshed = None
     while True:
         try:
-            await step_daddy.load_channels()
-            await asyncio.sleep(300)
-        except asyncio.CancelledError:
-            continue
+            if await shared_state.lead("refresh", ttl=LEADER_LEASE):
+                if refreshed is None or time.monotonic() - refreshed >= 300:
+                    # A new leader publishes once even if its own list did not change.
+                    if await step_daddy.load_channels() or refreshed is None:
+                        await step_daddy.publish_channels()
+                        _prefetch_logos()
+                    refreshed = time.monotonic()
+            else:
+                refreshed = None
+                await step_daddy.sync_channels()
+        except Exception:
+            pass
+        # Poll quickly until the leader has published a first list.
+        await asyncio.sleep(30 if step_daddy.channels else 2)
 
 
 def get_channels():
@@ -68,56 +314,151 @@ def get_channels():
 def get_channel(channel_id) -> Channel | None:
     if not channel_id or channel_id == "":
         return None
-    return next((channel for channel in step_daddy.channels if channel.id == channel_id), None)
+    return step_daddy.get_channel(channel_id)
 
 
-def _playlist_response() -> Response:
-    return Response(
-        content=step_daddy.playlist(),
-        media_type="application/vnd.apple.mpegurl",
-        headers={"Content-Disposition": "attachment; filename=playlist.m3u8"},
-    )
+def get_channels_page(query: str, offset: int, limit: int) -> tuple[list[Channel], int]:
+    channels = step_daddy.search_channels(query)
+    return channels[offset:offset + limit], len(channels)
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an ``Accept-Encoding`` header allows gzip; ``q=0`` refuses a coding."""
+    accepted = None
+    for item in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        coding = coding.lower()
+        if coding not in ("gzip", "*"):
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        # An explicit gzip entry wins over the wildcard.
+        if coding == "gzip":
+            return quality > 0
+        accepted = quality > 0
+    return bool(accepted)
+
+
+def _playlist_response(request: Request) -> Response:
+    snapshot = step_daddy.playlist()
+    compressed = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    etag = snapshot.gzip_etag if compressed else snapshot.etag
+    headers = {
+        "Content-Disposition": "attachment; filename=playlist.m3u8",
+        "ETag": etag,
+        "Last-Modified": snapshot.last_modified,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in etags or "*" in etags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=snapshot.gzip, media_type="application/vnd.apple.mpegurl", headers=headers)
+    return Response(content=snapshot.body, media_type="application/vnd.apple.mpegurl", headers=headers)
 
 
 @fastapi_app.get("/playlist.m3u8")
-def playlist_open():
+def playlist_open(request: Request):
     if secret_manager.load_secret():
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    return _playlist_response()
+    return _playlist_response(request)
 
 
 @fastapi_app.get("/{secret_code}/playlist.m3u8")
-def playlist(secret_code: str):
+def playlist(secret_code: str, request: Request):
     active_secret = secret_manager.load_secret()
     if active_secret:
         if secrets.compare_digest(secret_code, active_secret):
-            return _playlist_response()
+            return _playlist_response(request)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    return _playlist_response()
+    return _playlist_response(request)
+
+
+_schedule = EMPTY_SCHEDULE
+_schedule_flight = SingleFlight()
+
+
+async def _refresh_schedule() -> ScheduleSnapshot:
+    global _schedule
+    days = None
+    if not await shared_state.lead("refresh", ttl=LEADER_LEASE):
+        data = await shared_state.get("schedule")
+        if data is not None:
+            days = json.loads(data)
+    if days is None:
+        days = await step_daddy.schedule()
+        await shared_state.set("schedule", json.dumps(days).encode())
+    _schedule = parse_schedule(days)
+    return _schedule
+
+
+async def update_schedule():
+    while True:
+        try:
+            await _schedule_flight.run(None, _refresh_schedule)
+        except Exception:
+            pass
+        await asyncio.sleep(config.schedule_refresh_interval)
 
 
-async def get_schedule():
-    return await step_daddy.schedule()
+async def get_schedule() -> ScheduleSnapshot:
+    if _schedule is EMPTY_SCHEDULE:
+        return await _schedule_flight.run(None, _refresh_schedule)
+    return _schedule
+
+
+def search_events(query: str) -> list[str]:
+    return _schedule.index.search(query)
+
+
+async def _prewarm(channel_id: str, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        try:
+            # Re-resolve ahead of expiry so the entry is still fresh when viewers arrive.
+            await step_daddy.resolve(channel_id, min_remaining=2 * config.prewarm_interval)
+        except Exception:
+            pass
+
+
+async def prewarm_streams():
+    while config.prewarm_lead_minutes > 0:
+        now = datetime.now(UTC)
+        # Include events that kicked off moments ago; late viewers still arrive in bulk.
+        channel_ids = channel_ids_between(_schedule, now - timedelta(minutes=5), now + timedelta(minutes=config.prewarm_lead_minutes))
+        if not await shared_state.lead("refresh", ttl=LEADER_LEASE):
+            # Resolutions are shared, so only the leader needs to pre-resolve.
+            channel_ids = []
+        semaphore = asyncio.Semaphore(4)
+        await asyncio.gather(*(_prewarm(channel_id, semaphore) for channel_id in channel_ids))
+        await asyncio.sleep(config.prewarm_interval)
 
 
 @fastapi_app.get("/logo/{logo}")
-async def logo(logo: str):
+async def logo(logo: str, request: Request, variant: str | None = None):
+    if variant is not None and variant not in LOGO_VARIANTS:
+        return JSONResponse(content={"error": "Unknown logo variant"}, status_code=status.HTTP_404_NOT_FOUND)
     url = urlsafe_base64_decode(logo)
-    file = url.split("/")[-1]
-    if not os.path.exists("./logo-cache"):
-        os.makedirs("./logo-cache")
-    if os.path.exists(f"./logo-cache/{file}"):
-        return FileResponse(f"./logo-cache/{file}")
     try:
-        response = await client.get(url, headers={"user-agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:137.0) Gecko/20100101 Firefox/137.0"})
-        if response.status_code == 200:
-            with open(f"./logo-cache/{file}", "wb") as f:
-                f.write(response.content)
-            return FileResponse(f"./logo-cache/{file}")
-        else:
+        with STAGE_SECONDS.time(stage="logo"):
+            path = await logo_cache.get(url, variant)
+        if path is None:
             return JSONResponse(content={"error": "Logo not found"}, status_code=status.HTTP_404_NOT_FOUND)
+        # Browsers revalidate daily; the ETag follows the cached bytes, so unchanged logos cost a 304.
+        headers = {"ETag": await logo_cache.etag(path), "Cache-Control": "public, max-age=86400"}
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return FileResponse(path, headers=headers)
     except httpx.ConnectTimeout:
         return JSONResponse(content={"error": "Request timed out"}, status_code=status.HTTP_504_GATEWAY_TIMEOUT)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
@@ -5,7 +5,7 @@ from StepDaddyLiveHD.step_daddy import Channel
 def card(channel: Channel) -> rx.Component:
     return rx.box(
         rx.image(
-            src=channel.logo,
+            src=channel.backdrop,
             position="absolute",
             width="100%",
             height="100%",
@@ -32,7 +32,7 @@ def card(channel: Channel) -> rx.Component:
                 ),
                 rx.center(
                     rx.image(
-                        src=channel.logo,
+                        src=channel.thumbnail,
                         width="64px",
                         height="64px",
                         object_fit="contain",
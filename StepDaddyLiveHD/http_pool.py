@@ -0,0 +1,97 @@
+"""Upstream HTTP clients with bounded, per-host connection pools."""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+from curl_cffi import AsyncSession, CurlHttpVersion, CurlOpt
+
+from rxconfig import config
+
+
+class HostLimiter:
+    """Caps concurrent upstream requests per host and counts pool usage."""
+
+    def __init__(self, per_host: int):
+        self.per_host = per_host
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._stats: dict[str, dict[str, int]] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        host = urlsplit(url).netloc
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.per_host)
+            self._stats[host] = {"active": 0, "waiting": 0, "requests": 0, "errors": 0}
+        stats = self._stats[host]
+        stats["waiting"] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            stats["waiting"] -= 1
+        stats["active"] += 1
+        stats["requests"] += 1
+        try:
+            yield
+        except BaseException:
+            stats["errors"] += 1
+            raise
+        finally:
+            stats["active"] -= 1
+            semaphore.release()
+
+    def stats(self) -> dict:
+        return {"max_per_host": self.per_host, "hosts": {host: dict(stats) for host, stats in self._stats.items()}}
+
+
+host_limiter = HostLimiter(config.upstream_max_per_host)
+
+
+def create_session(proxy: str | None = None) -> AsyncSession:
+    return AsyncSession(
+        proxy=proxy,
+        max_clients=config.upstream_max_connections,
+        timeout=(config.upstream_connect_timeout, config.upstream_read_timeout),
+        http_version=CurlHttpVersion.V2TLS,
+        curl_options={
+            CurlOpt.TCP_KEEPALIVE: 1,
+            CurlOpt.TCP_KEEPIDLE: int(config.upstream_keepalive),
+            CurlOpt.TCP_KEEPINTVL: int(config.upstream_keepalive),
+        },
+    )
+
+
+def create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=True,
+        verify=False,
+        limits=httpx.Limits(
+            max_connections=config.upstream_max_connections,
+            max_keepalive_connections=config.upstream_max_connections,
+            keepalive_expiry=config.upstream_keepalive,
+        ),
+        timeout=httpx.Timeout(
+            config.upstream_read_timeout,
+            connect=config.upstream_connect_timeout,
+            pool=config.upstream_connect_timeout,
+        ),
+    )
+
+
+def session_stats(session: AsyncSession) -> dict:
+    # Idle handles sit in the session's queue; the rest are serving requests.
+    idle = session.pool.qsize()
+    return {"max_clients": session.max_clients, "in_use": session.max_clients - idle}
+
+
+def client_stats(client: httpx.AsyncClient) -> dict:
+    # httpx does not expose its pool publicly, so read it defensively.
+    connections = getattr(getattr(client._transport, "_pool", None), "connections", [])
+    return {
+        "connections": len(connections),
+        "idle": sum(1 for connection in connections if connection.is_idle()),
+    }
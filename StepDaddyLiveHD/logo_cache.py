@@ -0,0 +1,220 @@
+"""Bounded on-disk cache for channel logos.
+
+Logos are stored under a digest of their source URL, so different logos that
+share a file name never collide, while their ETags are a digest of the stored
+bytes, so a logo downloaded again with new content is not revalidated as the
+old one. Concurrent requests for a missing logo share
+one download, file system work runs off the event loop, and the least recently
+used files are removed once the cache grows past ``max_bytes``.
+
+Several backend workers may share the directory. Each keeps its own index, so
+eviction rescans the directory to count every worker's files against the cap,
+and a file another worker removed is downloaded again instead of served.
+
+When Pillow is available, small WebP variants of each logo are rendered once,
+right after the original is downloaded, so pages can show thumbnails instead of
+the full-size image.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, BinaryIO, Callable
+from urllib.parse import urlsplit
+
+from .cache import SingleFlight
+
+try:
+    from PIL import Image
+except ImportError:  # Variants are optional; the original logo is served instead.
+    Image = None
+
+
+# Bounding box in pixels of each pre-rendered logo variant.
+VARIANTS = {"thumb": 128, "backdrop": 48}
+
+
+class LogoCache:
+    def __init__(self, directory: str, max_bytes: int, fetch: Callable[[str], Awaitable[bytes | None]]):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._fetch = fetch
+        self._files: OrderedDict[str, int] = OrderedDict()
+        # ETag per file name, with the modification time and size it was computed for.
+        self._etags: dict[str, tuple[tuple[int, int], str]] = {}
+        self._flight = SingleFlight()
+        self._loaded = False
+
+    @staticmethod
+    def key(url: str, variant: str | None = None) -> str:
+        digest = hashlib.sha256(url.encode()).hexdigest()[:32]
+        if variant is not None:
+            return f"{digest}.{variant}.webp"
+        suffix = os.path.splitext(urlsplit(url).path)[1].lower()
+        if not suffix[1:].isalnum() or len(suffix) > 6:
+            suffix = ""
+        return digest + suffix
+
+    async def etag(self, path: Path) -> str:
+        """Validator derived from the file's bytes, so a logo re-downloaded with new content gets a new one."""
+        stat = await asyncio.to_thread(path.stat)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._etags.get(path.name)
+        if cached is None or cached[0] != signature:
+            digest = await asyncio.to_thread(self._digest, path)
+            cached = self._etags[path.name] = (signature, f'"{digest}"')
+        return cached[1]
+
+    @staticmethod
+    def _digest(path: Path) -> str:
+        return hashlib.sha256(path.read_bytes()).hexdigest()[:32]
+
+    async def get(self, url: str, variant: str | None = None) -> Path | None:
+        if not self._loaded:
+            await self._flight.run(None, self._load)
+        name = self.key(url, variant)
+        if name in self._files:
+            path = self.directory / name
+            if await asyncio.to_thread(path.exists):
+                self._files.move_to_end(name)
+                return path
+            self.size -= self._files.pop(name)
+        if variant is None:
+            return await self._flight.run(name, self._download, url, name)
+        original = await self.get(url)
+        if original is None or Image is None:
+            return original
+        try:
+            path = await self._flight.run(name, self._render, original, name, VARIANTS[variant])
+        except Exception:
+            return original
+        await self._evict()
+        return path
+
+    async def prefetch(self, urls: list[str], concurrency: int):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(url: str):
+            async with semaphore:
+                try:
+                    await self.get(url)
+                except Exception:
+                    pass
+
+        if not self._loaded:
+            await self._flight.run(None, self._load)
+        await asyncio.gather(*(fetch(url) for url in dict.fromkeys(urls) if self.key(url) not in self._files))
+
+    async def _load(self):
+        files = await asyncio.to_thread(self._scan)
+        for name, size in files:
+            if name not in self._files:
+                self._files[name] = size
+                self._files.move_to_end(name, last=False)
+                self.size += size
+        self._loaded = True
+        await self._evict()
+
+    def _scan(self) -> list[tuple[str, int]]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith(".") and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        # Most recently used first, matching the order entries are inserted at the front.
+        files.sort(reverse=True)
+        return [(name, size) for _, name, size in files]
+
+    async def _download(self, url: str, name: str) -> Path | None:
+        content = await self._fetch(url)
+        if content is None:
+            return None
+        path = self.directory / name
+        await asyncio.to_thread(self._write, path, content)
+        self._add(name, len(content))
+        if Image is not None:
+            for variant, size in VARIANTS.items():
+                try:
+                    await self._render(path, self.key(url, variant), size)
+                except Exception:
+                    break
+        await self._evict()
+        return path
+
+    async def _render(self, original: Path, name: str, size: int) -> Path:
+        path = self.directory / name
+        self._add(name, await asyncio.to_thread(self._thumbnail, original, path, size))
+        return path
+
+    def _add(self, name: str, size: int):
+        self.size += size - self._files.pop(name, 0)
+        self._files[name] = size
+
+    @staticmethod
+    def _replace(path: Path, write: Callable[[BinaryIO], None]):
+        # Workers sharing the directory may fill the same file at once, so each write gets its own temporary file.
+        descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                write(file)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    @classmethod
+    def _thumbnail(cls, original: Path, path: Path, size: int) -> int:
+        with Image.open(original) as image:
+            image = image.convert("RGBA")
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            cls._replace(path, lambda file: image.save(file, format="WEBP", quality=80, method=6))
+        return path.stat().st_size
+
+    @classmethod
+    def _write(cls, path: Path, content: bytes):
+        cls._replace(path, lambda file: file.write(content))
+
+    async def _evict(self):
+        if self.size > self.max_bytes:
+            await self._rescan()
+        evicted = []
+        while self.size > self.max_bytes and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self.size -= size
+            self._etags.pop(name, None)
+            evicted.append(self.directory / name)
+        if evicted:
+            await asyncio.to_thread(self._remove, evicted)
+
+    async def _rescan(self):
+        """Bring the index in line with the directory, which other workers also write to."""
+        known = list(self._files)
+        files = dict(await asyncio.to_thread(self._scan))
+        # Only forget files that were indexed before the scan; newer ones may be missing from it.
+        for name in known:
+            if name not in files and name in self._files:
+                self.size -= self._files.pop(name)
+        # Files only other workers have used count as the least recently used here, oldest first.
+        for name, size in files.items():
+            if name in self._files:
+                self.size += size - self._files[name]
+                self._files[name] = size
+            else:
+                self._files[name] = size
+                self._files.move_to_end(name, last=False)
+                self.size += size
+
+    @staticmethod
+    def _remove(paths: list[Path]):
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {"files": len(self._files), "bytes": self.size, "max_bytes": self.max_bytes}
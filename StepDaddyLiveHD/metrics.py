@@ -0,0 +1,214 @@
+"""Minimal Prometheus-style metrics, rendered in the text exposition format.
+
+Only what the app needs is implemented: labelled counters, gauges and
+histograms, plus gauges and counters whose values are read from a function
+when ``/metrics`` is scraped, so existing ``stats()`` counters need no
+duplicate bookkeeping.
+"""
+
+from __future__ import annotations
+
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+from urllib.parse import urlsplit
+
+
+LabelValues = tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: list[_Metric] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        function: Callable[[], dict[LabelValues, float]] | None = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._function = function
+        self._values: dict[LabelValues, float] = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[tuple[str, LabelValues, float]]:
+        values = self._function() if self._function is not None else self._values
+        for labels, value in values.items():
+            yield self.name, labels, value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(self._sample_labelnames(name), labels)} {_format_value(value)}")
+        return lines
+
+    def _sample_labelnames(self, name: str) -> tuple[str, ...]:
+        return self.labelnames
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: count per bucket (the last one is +Inf), then the sum.
+        self._observations: dict[LabelValues, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        observation = self._observations.get(key)
+        if observation is None:
+            observation = self._observations[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        observation[0][bisect.bisect_left(self.buckets, value)] += 1
+        observation[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[tuple[str, LabelValues, float]]:
+        for labels, (counts, total) in self._observations.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", (*labels, _format_value(bound)), cumulative
+            yield f"{self.name}_sum", labels, total[0]
+            yield f"{self.name}_count", labels, cumulative
+
+    def _sample_labelnames(self, name: str) -> tuple[str, ...]:
+        if name.endswith("_bucket"):
+            return (*self.labelnames, "le")
+        return self.labelnames
+
+
+class ViewerTracker:
+    """Counts distinct clients per channel that fetched a playlist recently.
+
+    Client addresses come from request headers, so entries are pruned as they
+    are added and each channel keeps at most ``max_clients`` of them.
+    """
+
+    def __init__(self, window: float, max_clients: int = 10000):
+        self.window = window
+        self.max_clients = max_clients
+        # Per channel, clients in the order they were last seen.
+        self._seen: dict[str, dict[str, float]] = {}
+        self._swept = time.monotonic()
+
+    def seen(self, channel_id: str, client: str):
+        now = time.monotonic()
+        clients = self._seen.setdefault(channel_id, {})
+        clients.pop(client, None)
+        clients[client] = now
+        self._prune(clients, now - self.window)
+        if now - self._swept >= self.window:
+            # Channels nobody watches any more are only dropped here.
+            self._sweep(now)
+
+    def _prune(self, clients: dict[str, float], cutoff: float):
+        while clients:
+            client, seen = next(iter(clients.items()))
+            if seen >= cutoff and len(clients) <= self.max_clients:
+                break
+            del clients[client]
+
+    def _sweep(self, now: float):
+        self._swept = now
+        for channel_id in list(self._seen):
+            clients = self._seen[channel_id]
+            self._prune(clients, now - self.window)
+            if not clients:
+                del self._seen[channel_id]
+
+    def counts(self) -> dict[LabelValues, float]:
+        self._sweep(time.monotonic())
+        return {(channel_id,): len(clients) for channel_id, clients in self._seen.items()}
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    lines.append("")
+    return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram(
+    "stepdaddy_stage_seconds",
+    "Time spent in each stage of the stream pipeline and proxy endpoints.",
+    ("stage",),
+)
+UPSTREAM_RESPONSES = Counter(
+    "stepdaddy_upstream_responses_total",
+    "Upstream responses by host and status code; failed requests count as status error.",
+    ("host", "status"),
+)
+PROXIED_BYTES = Counter(
+    "stepdaddy_proxied_bytes_total",
+    "Media bytes sent to viewers per channel.",
+    ("channel",),
+)
+viewers = ViewerTracker(window=60)
+ACTIVE_VIEWERS = Gauge(
+    "stepdaddy_active_viewers",
+    "Distinct clients that fetched a channel's playlist in the last minute.",
+    ("channel",),
+    function=viewers.counts,
+)
+
+
+def count_response(url: str, status: int | str):
+    UPSTREAM_RESPONSES.inc(host=urlsplit(url).netloc, status=str(status))
@@ -1,23 +1,9 @@
 import reflex as rx
-from typing import Dict, List, TypedDict
-from zoneinfo import ZoneInfo
+from typing import Dict, List
 from datetime import datetime, timedelta
-from dateutil import parser
 from StepDaddyLiveHD import backend
 from StepDaddyLiveHD.components import navbar
-
-
-class ChannelItem(TypedDict):
-    name: str
-    id: str
-
-
-class EventItem(TypedDict):
-    name: str
-    time: str
-    dt: datetime
-    category: str
-    channels: List[ChannelItem]
+from StepDaddyLiveHD.schedule_store import UTC, EventItem, event_key
 
 
 class ScheduleState(rx.State):
@@ -26,23 +12,6 @@ class ScheduleState(rx.State):
     switch: bool = True
     search_query: str = ""
 
-    @staticmethod
-    def get_channels(channels: dict) -> List[ChannelItem]:
-        channel_list = []
-        if isinstance(channels, list):
-            for channel in channels:
-                try:
-                    channel_list.append(ChannelItem(name=channel["channel_name"], id=channel["channel_id"]))
-                except:
-                    continue
-        elif isinstance(channels, dict):
-            for channel_dic in channels:
-                try:
-                    channel_list.append(ChannelItem(name=channels[channel_dic]["channel_name"], id=channels[channel_dic]["channel_id"]))
-                except:
-                    continue
-        return channel_list
-
     def toggle_category(self, category):
         self.categories[category] = not self.categories.get(category, False)
 
@@ -54,24 +23,9 @@ class ScheduleState(rx.State):
                 self.categories[cat] = True
 
     async def on_load(self):
-        self.events = []
-        categories = {}
-        days = await backend.get_schedule()
-        for day in days:
-            name = day.split(" - ")[0]
-            dt = parser.parse(name, dayfirst=True)
-            for category in days[day]:
-                categories[category] = True
-                for event in days[day][category]:
-                    time = event["time"]
-                    hour, minute = map(int, time.split(":"))
-                    event_dt = dt.replace(hour=hour, minute=minute).replace(tzinfo=ZoneInfo("UTC"))
-                    channels = self.get_channels(event.get("channels"))
-                    channels.extend(self.get_channels(event.get("channels2")))
-                    channels.sort(key=lambda channel: channel["name"])
-                    self.events.append(EventItem(name=event["event"], time=time, dt=event_dt, category=category, channels=channels))
-        self.categories = dict(sorted(categories.items()))
-        self.events.sort(key=lambda event: event["dt"])
+        schedule = await backend.get_schedule()
+        self.events = list(schedule.events)
+        self.categories = {category: True for category in schedule.categories}
 
     @rx.event
     def set_switch(self, value: bool):
@@ -83,14 +37,14 @@ class ScheduleState(rx.State):
 
     @rx.var
     def filtered_events(self) -> List[EventItem]:
-        now = datetime.now(ZoneInfo("UTC")) - timedelta(minutes=30)
-        query = self.search_query.strip().lower()
+        now = datetime.now(UTC) - timedelta(minutes=30)
+        matches = set(backend.search_events(self.search_query)) if self.search_query.strip() else None
 
         return [
             event for event in self.events
             if self.categories.get(event["category"], False)
                and (not self.switch or event["dt"] > now)
-               and (query == "" or query in event["name"].lower())
+               and (matches is None or event_key(event) in matches)
         ]
 
 
@@ -141,7 +95,7 @@ def schedule() -> rx.Component:
                         ScheduleState.categories,
                         rx.card(
                             rx.input(
-                                placeholder="Search events...",
+                                placeholder="Search events or #categories...",
                                 on_change=ScheduleState.set_search_query,
                                 value=ScheduleState.search_query,
                                 width="100%",
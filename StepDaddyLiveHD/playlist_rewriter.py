@@ -0,0 +1,72 @@
+"""Rewrites upstream HLS media playlists so keys and segments go through this server."""
+
+from __future__ import annotations
+
+import re
+from urllib.parse import urljoin
+
+from .utils import encrypt
+from rxconfig import config
+
+
+URI_PATTERN = re.compile(r'URI="([^"]*)"')
+
+
+def key_url(url: str, host: str) -> str:
+    return f"{config.api_url}/key/{encrypt(url)}/{encrypt(host)}"
+
+
+class PlaylistRewriter:
+    """Rewrites successive versions of one channel's playlist.
+
+    Live playlists are a sliding window, so most lines repeat from one poll to
+    the next. Rewritten lines are remembered for the previous version and only
+    new lines are rewritten again.
+    """
+
+    def __init__(self, channel_id: str | None = None):
+        # Passed along on proxied segment URLs so their traffic can be attributed to the channel.
+        self._query = f"?channel={channel_id}" if channel_id is not None else ""
+        self._base_url = None
+        self._host = None
+        self._lines: dict[str, str] = {}
+
+    def rewrite(self, text: str, base_url: str, host: str) -> str:
+        if (base_url, host) != (self._base_url, self._host):
+            self._base_url, self._host = base_url, host
+            self._lines = {}
+        previous = self._lines
+        lines = {}
+        output = []
+        for line in text.split("\n"):
+            rewritten = lines.get(line)
+            if rewritten is None:
+                rewritten = previous.get(line)
+                if rewritten is None:
+                    rewritten = self._rewrite_line(line)
+                lines[line] = rewritten
+            output.append(rewritten)
+        self._lines = lines
+        output.append("")
+        return "\n".join(output)
+
+    def _rewrite_line(self, line: str) -> str:
+        if line.startswith("#EXT-X-KEY:"):
+            return URI_PATTERN.sub(self._key_uri, line, count=1)
+        if line.startswith("#EXT-X-MAP:"):
+            return URI_PATTERN.sub(self._map_uri, line, count=1)
+        if not line or line.startswith("#"):
+            return line
+        return self._segment_url(line)
+
+    def _key_uri(self, match: re.Match) -> str:
+        return f'URI="{key_url(urljoin(self._base_url, match.group(1)), self._host)}"'
+
+    def _map_uri(self, match: re.Match) -> str:
+        return f'URI="{self._segment_url(match.group(1))}"'
+
+    def _segment_url(self, uri: str) -> str:
+        url = urljoin(self._base_url, uri.strip())
+        if config.proxy_content:
+            return f"{config.api_url}/content/{encrypt(url)}{self._query}"
+        return url
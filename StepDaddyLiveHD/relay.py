@@ -0,0 +1,236 @@
+"""Live relay of upstream channels.
+
+In relay mode every channel that is being watched has exactly one background
+task polling its upstream media playlist. New segments and keys are fetched
+once into a small in-memory ring buffer and viewers are served a locally
+generated playlist pointing at that buffer, so the number of viewers no longer
+changes how often upstream is contacted. A relay stops once nobody has asked
+for its playlist for ``idle_timeout`` seconds.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Awaitable, Callable
+from urllib.parse import urljoin, urlparse
+
+from .playlist_rewriter import URI_PATTERN, key_url
+from rxconfig import config
+
+if TYPE_CHECKING:
+    from .step_daddy import StepDaddy
+
+
+# Segment tags that belong to the segment following them and are copied as-is.
+SEGMENT_TAGS = ("#EXTINF:", "#EXT-X-PROGRAM-DATE-TIME:", "#EXT-X-BYTERANGE:")
+
+
+@dataclass
+class UpstreamSegment:
+    sequence: int
+    url: str
+    tags: list[str] = field(default_factory=list)
+    key: str | None = None
+
+
+def parse_media_playlist(text: str, base_url: str) -> tuple[float, list[UpstreamSegment]]:
+    """Return the target duration and segments of an HLS media playlist."""
+    sequence = 0
+    target_duration = 6.0
+    key = None
+    tags = []
+    segments = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-TARGETDURATION:"):
+            target_duration = float(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-KEY:"):
+            key = line
+        elif line.startswith(SEGMENT_TAGS) or line == "#EXT-X-DISCONTINUITY":
+            tags.append(line)
+        elif line and not line.startswith("#"):
+            segments.append(UpstreamSegment(sequence + len(segments), urljoin(base_url, line), tags, key))
+            tags = []
+    return target_duration, segments
+
+
+class ChannelRelay:
+    def __init__(
+        self,
+        channel_id: str,
+        step_daddy: StepDaddy,
+        fetch_segment: Callable[[str], Awaitable[bytes | Path]],
+        idle_timeout: float,
+    ):
+        self.channel_id = channel_id
+        self.idle_timeout = idle_timeout
+        self.last_access = time.monotonic()
+        self.polls = 0
+        self._step_daddy = step_daddy
+        self._fetch_segment = fetch_segment
+        self._segments: dict[int, tuple[UpstreamSegment, bytes | Path]] = {}
+        self._pending: set[int] = set()
+        self._target_duration = 6.0
+        self._playlist: asyncio.Future[str] = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def running(self) -> bool:
+        return not self._task.done()
+
+    async def playlist(self) -> str:
+        self.last_access = time.monotonic()
+        return await asyncio.shield(self._playlist)
+
+    def segment(self, sequence: int) -> bytes | Path | None:
+        entry = self._segments.get(sequence)
+        return entry[1] if entry is not None else None
+
+    def stop(self):
+        self._task.cancel()
+
+    async def _run(self):
+        try:
+            while time.monotonic() - self.last_access < self.idle_timeout:
+                started = time.monotonic()
+                try:
+                    await self._poll()
+                except Exception as e:
+                    # Viewers waiting for the first playlist get the error; later failures keep the last one.
+                    if not self._playlist.done():
+                        self._playlist.set_exception(e)
+                        self._playlist.exception()
+                        return
+                self.polls += 1
+                await asyncio.sleep(max(self._target_duration - (time.monotonic() - started), 1))
+        finally:
+            if not self._playlist.done():
+                self._playlist.cancel()
+            self._segments.clear()
+
+    async def _poll(self):
+        resolved, m3u8 = await self._step_daddy.upstream_playlist(self.channel_id)
+        host = urlparse(resolved.source_url).netloc
+        self._target_duration, segments = parse_media_playlist(m3u8.text, str(m3u8.url))
+        if not segments:
+            raise ValueError("Upstream playlist has no segments")
+        new = [segment for segment in segments if segment.sequence not in self._segments and segment.sequence not in self._pending]
+        keys = set()
+        for segment in new:
+            match = segment.key and URI_PATTERN.search(segment.key)
+            if match:
+                url = urljoin(segment.url, match.group(1))
+                keys.add(url)
+                segment.key = URI_PATTERN.sub(lambda _: f'URI="{key_url(url, host)}"', segment.key, count=1)
+        results = await asyncio.gather(
+            *(self._step_daddy.get_key(url, host) for url in keys),
+            *(self._fetch(segment) for segment in new),
+            return_exceptions=True,
+        )
+        self._publish(segments[0].sequence)
+        if not self._playlist.done():
+            # Nothing could be published yet; fail the viewers waiting for the first playlist.
+            errors = [result for result in results[len(keys):] if isinstance(result, Exception)]
+            raise errors[0] if errors else ValueError("No relay segments available")
+
+    async def _fetch(self, segment: UpstreamSegment):
+        self._pending.add(segment.sequence)
+        try:
+            self._segments[segment.sequence] = (segment, await self._fetch_segment(segment.url))
+        finally:
+            self._pending.discard(segment.sequence)
+
+    def _publish(self, first_sequence: int):
+        sequences = sorted(self._segments)
+        # Keep a couple of segments that just left the upstream window for players still downloading them.
+        start = 0
+        while start < len(sequences) and sequences[start] < first_sequence - 2:
+            start += 1
+        # Media sequence numbers only work for a contiguous run. Segments lost upstream
+        # end the run before them; segments still upstream are retried on the next poll.
+        end = start + 1
+        while end < len(sequences):
+            if sequences[end] != sequences[end - 1] + 1:
+                if sequences[end - 1] + 1 >= first_sequence:
+                    break
+                start = end
+            end += 1
+        for sequence in sequences[:start]:
+            del self._segments[sequence]
+        if start >= len(sequences):
+            return
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(self._target_duration)}",
+            f"#EXT-X-MEDIA-SEQUENCE:{sequences[start]}",
+        ]
+        key = None
+        for sequence in sequences[start:end]:
+            segment, _ = self._segments[sequence]
+            if segment.key != key:
+                key = segment.key
+                lines.append(key or "#EXT-X-KEY:METHOD=NONE")
+            lines.extend(segment.tags)
+            lines.append(f"{config.api_url}/relay/{self.channel_id}/{sequence}.ts")
+        lines.append("")
+        if self._playlist.done():
+            self._playlist = asyncio.get_running_loop().create_future()
+        self._playlist.set_result("\n".join(lines))
+
+    def stats(self) -> dict:
+        return {
+            "segments": len(self._segments),
+            "bytes": sum(len(data) for _, data in self._segments.values() if isinstance(data, bytes)),
+            "polls": self.polls,
+            "idle": round(time.monotonic() - self.last_access, 1),
+        }
+
+
+class RelayManager:
+    """Starts one relay per watched channel and forgets relays that went idle."""
+
+    def __init__(self, step_daddy: StepDaddy, fetch_segment: Callable[[str], Awaitable[bytes | Path]], idle_timeout: float):
+        self.idle_timeout = idle_timeout
+        self._step_daddy = step_daddy
+        self._fetch_segment = fetch_segment
+        self._relays: dict[str, ChannelRelay] = {}
+
+    def _relay(self, channel_id: str) -> ChannelRelay:
+        relay = self._relays.get(channel_id)
+        if relay is None or not relay.running:
+            relay = self._relays[channel_id] = ChannelRelay(channel_id, self._step_daddy, self._fetch_segment, self.idle_timeout)
+        return relay
+
+    async def playlist(self, channel_id: str) -> str:
+        relay = self._relay(channel_id)
+        try:
+            return await relay.playlist()
+        except asyncio.CancelledError:
+            if relay.running:
+                raise
+            # The relay went idle while this request waited; start a new one.
+            return await self._relay(channel_id).playlist()
+        except Exception:
+            self._relays.pop(channel_id, None)
+            raise
+
+    def segment(self, channel_id: str, sequence: int) -> bytes | Path | None:
+        relay = self._relays.get(channel_id)
+        if relay is None:
+            return None
+        return relay.segment(sequence)
+
+    def stop(self):
+        for relay in self._relays.values():
+            relay.stop()
+        self._relays.clear()
+
+    def stats(self) -> dict:
+        return {channel_id: relay.stats() for channel_id, relay in self._relays.items() if relay.running}
@@ -0,0 +1,99 @@
+"""Parsed, shared snapshot of the upstream event schedule."""
+
+from __future__ import annotations
+
+import time
+from datetime import datetime
+from typing import List, NamedTuple, TypedDict
+from zoneinfo import ZoneInfo
+
+from dateutil import parser
+
+from .search_index import SearchIndex, normalize
+
+
+UTC = ZoneInfo("UTC")
+
+
+class ChannelItem(TypedDict):
+    name: str
+    id: str
+
+
+class EventItem(TypedDict):
+    name: str
+    time: str
+    dt: datetime
+    category: str
+    channels: List[ChannelItem]
+
+
+class ScheduleSnapshot(NamedTuple):
+    events: tuple[EventItem, ...]
+    categories: tuple[str, ...]
+    index: SearchIndex[str]
+    updated: float
+
+
+EMPTY_SCHEDULE = ScheduleSnapshot(events=(), categories=(), index=SearchIndex([]), updated=0.0)
+
+
+def event_key(event: EventItem) -> str:
+    return f"{event['dt'].isoformat()}|{event['category']}|{event['name']}"
+
+
+def category_tag(category: str) -> str:
+    """Search tag for an event category, e.g. ``#amfootball`` for "Am. Football"."""
+    return "#" + "".join(char for char in normalize(category) if char.isalnum())
+
+
+def channel_ids_between(schedule: ScheduleSnapshot, start: datetime, end: datetime) -> List[str]:
+    channel_ids = {}
+    for event in schedule.events:
+        if event["dt"] > end:
+            break
+        if event["dt"] >= start:
+            channel_ids.update((channel["id"], None) for channel in event["channels"])
+    return list(channel_ids)
+
+
+def get_channels(channels: dict) -> List[ChannelItem]:
+    channel_list = []
+    if isinstance(channels, list):
+        for channel in channels:
+            try:
+                channel_list.append(ChannelItem(name=channel["channel_name"], id=channel["channel_id"]))
+            except:
+                continue
+    elif isinstance(channels, dict):
+        for channel_dic in channels:
+            try:
+                channel_list.append(ChannelItem(name=channels[channel_dic]["channel_name"], id=channels[channel_dic]["channel_id"]))
+            except:
+                continue
+    return channel_list
+
+
+def parse_schedule(days: dict) -> ScheduleSnapshot:
+    events = []
+    categories = set()
+    for day in days:
+        name = day.split(" - ")[0]
+        dt = parser.parse(name, dayfirst=True)
+        for category in days[day]:
+            categories.add(category)
+            for event in days[day][category]:
+                event_time = event["time"]
+                hour, minute = map(int, event_time.split(":"))
+                event_dt = dt.replace(hour=hour, minute=minute, tzinfo=UTC)
+                channels = get_channels(event.get("channels"))
+                channels.extend(get_channels(event.get("channels2")))
+                channels.sort(key=lambda channel: channel["name"])
+                events.append(EventItem(name=event["event"], time=event_time, dt=event_dt, category=category, channels=channels))
+    events.sort(key=lambda event: event["dt"])
+    return ScheduleSnapshot(
+        events=tuple(events),
+        categories=tuple(sorted(categories)),
+        index=SearchIndex((event_key(event), event["name"], (category_tag(event["category"]),)) for event in events),
+        updated=time.time(),
+    )
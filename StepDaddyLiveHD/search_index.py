@@ -0,0 +1,95 @@
+"""Precomputed search index for channel and event names.
+
+The index is built once per refresh and answers queries without touching the
+full list: names are normalized up front, a trigram index narrows substring
+matches to a few candidates, and tags (``#sports``, country flags, schedule
+categories) map directly to the documents carrying them.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Generic, Hashable, Iterable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+|#\w+|\S", re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.split())
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex(Generic[K]):
+    def __init__(self, documents: Iterable[tuple[K, str, Iterable[str]]]):
+        self._keys: list[K] = []
+        self._names: list[str] = []
+        # Space-prefixed tokens, so " " + word in it tells whether any token starts with word.
+        self._tokens: list[str] = []
+        self._trigrams: dict[str, set[int]] = {}
+        self._tags: dict[str, set[int]] = {}
+        for position, (key, name, tags) in enumerate(documents):
+            name = normalize(name)
+            self._keys.append(key)
+            self._names.append(name)
+            self._tokens.append(" " + " ".join(TOKEN_PATTERN.findall(name)))
+            for trigram in _trigrams(name):
+                self._trigrams.setdefault(trigram, set()).add(position)
+            for tag in tags:
+                self._tags.setdefault(normalize(tag), set()).add(position)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def search(self, query: str, tags: Iterable[str] = ()) -> list[K]:
+        """Return keys matching ``query``, best matches first.
+
+        Query words that are known tags filter by tag instead of matching the
+        name; every other word must occur in the name. Exact names rank first,
+        then names starting with the query, then names with a word starting
+        with it, then any other match; ties keep the original document order.
+        """
+        words = []
+        tag_filters = [normalize(tag) for tag in tags]
+        for word in normalize(query).split(" "):
+            if word in self._tags:
+                tag_filters.append(word)
+            elif word:
+                words.append(word)
+
+        candidates = None
+        for tag in tag_filters:
+            positions = self._tags.get(tag, set())
+            candidates = positions if candidates is None else candidates & positions
+        for word in words:
+            for trigram in _trigrams(word):
+                positions = self._trigrams.get(trigram, set())
+                candidates = positions if candidates is None else candidates & positions
+        if candidates is None:
+            candidates = range(len(self._keys))
+
+        text = " ".join(words)
+        token_prefix = " " + words[0] if words else ""
+        ranked = []
+        for position in candidates:
+            name = self._names[position]
+            if not all(word in name for word in words):
+                continue
+            if not text or name == text:
+                rank = 0
+            elif name.startswith(text):
+                rank = 1
+            elif token_prefix in self._tokens[position]:
+                rank = 2
+            else:
+                rank = 3
+            ranked.append((rank, position))
+        ranked.sort()
+        return [self._keys[position] for _, position in ranked]
@@ -0,0 +1,235 @@
+"""Shared in-memory cache for proxied media segments.
+
+The first request for a segment starts a single upstream download that fills
+the cache; concurrent requests for the same segment tail that in-flight buffer
+instead of opening their own upstream connection, and later requests are served
+from memory. Completed segments are evicted least-recently-used once the total
+size exceeds ``max_bytes``. A download is cancelled as soon as every request
+reading it has disconnected; requests that read a range to its end do not count.
+
+With a :class:`~.spool.SegmentSpool`, completed segments are moved to disk
+instead and only in-flight downloads are held in memory.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from typing import AsyncContextManager, AsyncIterator, Callable, Protocol
+
+from .spool import SegmentSpool, SpooledSegment
+
+
+DEFAULT_MEDIA_TYPE = "application/octet-stream"
+
+
+class UpstreamResponse(Protocol):
+    """The parts of an ``httpx.Response`` the cache reads."""
+
+    headers: dict
+
+    def aiter_raw(self, chunk_size: int | None = None) -> AsyncIterator[bytes]: ...
+
+    def aiter_bytes(self, chunk_size: int | None = None) -> AsyncIterator[bytes]: ...
+
+
+class Segment:
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.size = 0
+        self.done = False
+        self.error: BaseException | None = None
+        self.media_type = DEFAULT_MEDIA_TYPE
+        # Total size announced by upstream; None until known or when upstream does not say.
+        self.length: int | None = None
+        self.readers = 0
+        self.on_abandoned: Callable[[], None] | None = None
+        self._started = asyncio.Event()
+        self._changed = asyncio.Event()
+
+    def start(self, media_type: str | None, length: int | None):
+        self.media_type = media_type or DEFAULT_MEDIA_TYPE
+        self.length = length
+        self._started.set()
+
+    def append(self, chunk: bytes):
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        self._notify()
+
+    def finish(self, error: BaseException | None = None):
+        self.done = True
+        self.error = error
+        if error is None:
+            self.length = self.size
+        self._started.set()
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def ready(self):
+        """Wait until the upstream headers are known; raises if the download failed before that."""
+        await self._started.wait()
+        if self.error is not None and not self.size:
+            raise self.error
+
+    def reader(self, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        """Iterate over bytes ``start`` to ``end`` (exclusive) as they arrive."""
+        self.readers += 1
+        return self._tail(start, end)
+
+    async def _tail(self, start: int, end: int | None) -> AsyncIterator[bytes]:
+        index = 0
+        offset = 0
+        abandoned = False
+        try:
+            while True:
+                while index < len(self.chunks):
+                    chunk = self.chunks[index]
+                    index += 1
+                    chunk_start, offset = offset, offset + len(chunk)
+                    if offset <= start:
+                        continue
+                    if end is not None and chunk_start >= end:
+                        return
+                    if chunk_start < start or (end is not None and offset > end):
+                        chunk = chunk[max(start - chunk_start, 0):None if end is None else end - chunk_start]
+                    yield chunk
+                if end is not None and offset >= end:
+                    return
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        except (GeneratorExit, asyncio.CancelledError):
+            # Closed before its end: the request went away. A range that ran to its end did not.
+            abandoned = True
+            raise
+        finally:
+            self.readers -= 1
+            if abandoned and not self.readers and not self.done and self.on_abandoned is not None:
+                self.on_abandoned()
+
+
+class SegmentCache:
+    def __init__(
+        self,
+        fetch: Callable[[str], AsyncContextManager[UpstreamResponse]],
+        max_bytes: int,
+        max_segment_bytes: int = 32 * 1024 * 1024,
+        spool: SegmentSpool | None = None,
+        chunk_size: int | None = None,
+    ):
+        self._fetch = fetch
+        self.spool = spool
+        self.max_bytes = max_bytes
+        self.max_segment_bytes = min(max_segment_bytes, max_bytes)
+        # None passes upstream reads through as they arrive instead of re-buffering them.
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        self._segments: OrderedDict[str, Segment] = OrderedDict()
+        self._inflight: dict[str, Segment] = {}
+        self._tasks: dict[Segment, asyncio.Task] = {}
+
+    def spooled(self, url: str) -> SpooledSegment | None:
+        """Return the spooled file of a completed segment, if there is one."""
+        if self.spool is None:
+            return None
+        spooled = self.spool.get(url)
+        if spooled is not None:
+            self.hits += 1
+        return spooled
+
+    async def get(self, url: str) -> Segment:
+        """Return the segment once its headers are known, joining or starting its download."""
+        segment = self._segments.get(url)
+        if segment is not None:
+            self._segments.move_to_end(url)
+            self.hits += 1
+            return segment
+        segment = self._inflight.get(url)
+        if segment is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            segment = self._inflight[url] = Segment()
+            segment.on_abandoned = lambda: self._abandon(url, segment)
+            task = asyncio.create_task(self._fill(url, segment))
+            self._tasks[segment] = task
+            task.add_done_callback(lambda _: self._tasks.pop(segment, None))
+        # Count the caller as a reader while it waits, so the download is not abandoned under it.
+        segment.readers += 1
+        try:
+            await segment.ready()
+        finally:
+            segment.readers -= 1
+        return segment
+
+    def _abandon(self, url: str, segment: Segment):
+        # Nobody is reading any more; a half-downloaded segment is not worth finishing.
+        if self._inflight.get(url) is segment:
+            del self._inflight[url]
+        task = self._tasks.get(segment)
+        if task is not None:
+            self.abandoned += 1
+            task.cancel()
+
+    async def _fill(self, url: str, segment: Segment):
+        try:
+            async with self._fetch(url) as response:
+                length = response.headers.get("content-length")
+                if "content-encoding" in response.headers:
+                    # Decoded bytes no longer match the announced length.
+                    segment.start(response.headers.get("content-type"), None)
+                    chunks = response.aiter_bytes(self.chunk_size)
+                else:
+                    segment.start(response.headers.get("content-type"), int(length) if length and length.isdigit() else None)
+                    chunks = response.aiter_raw(self.chunk_size)
+                async for chunk in chunks:
+                    segment.append(chunk)
+        except BaseException as e:
+            segment.finish(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            segment.finish()
+            if self.spool is None:
+                self._store(url, segment)
+            else:
+                # Requests keep tailing the in-memory copy until the file is in place.
+                try:
+                    await self.spool.put(url, segment.chunks, segment.media_type)
+                except OSError:
+                    self._store(url, segment)
+        finally:
+            if self._inflight.get(url) is segment:
+                del self._inflight[url]
+
+    def _store(self, url: str, segment: Segment):
+        if self.max_bytes <= 0 or segment.size > self.max_segment_bytes:
+            return
+        self._segments[url] = segment
+        self.size += segment.size
+        while self.size > self.max_bytes:
+            _, evicted = self._segments.popitem(last=False)
+            self.size -= evicted.size
+
+    def stats(self) -> dict:
+        return {
+            "segments": len(self._segments),
+            "inflight": len(self._inflight),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "spool": self.spool.stats() if self.spool is not None else None,
+        }
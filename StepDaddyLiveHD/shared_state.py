@@ -0,0 +1,134 @@
+"""State shared between backend worker processes.
+
+With ``REDIS_URL`` set, Reflex runs several backend workers, and each one
+reads the channel list, stream resolutions, keys and the schedule through
+Redis, so upstream work done by one worker is reused by the others. A lease
+elects one leader, which is the only worker that refreshes channels and the
+schedule and pre-resolves streams. Without Redis there is a single worker: it
+is always the leader and keeps everything in its own local caches.
+
+Values are bytes; callers choose the encoding.
+"""
+
+from __future__ import annotations
+
+import os
+import uuid
+
+try:
+    import redis
+    import redis.asyncio
+except ImportError:  # Only needed when REDIS_URL is set.
+    redis = None
+
+from rxconfig import config
+
+
+# Extend a lease only while this worker still holds it.
+RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class LocalBackend:
+    """Single-process backend; with no other worker to share with, nothing is stored.
+
+    The local caches already hold everything, so keeping a second copy here
+    would only grow memory.
+    """
+
+    async def get(self, key: str) -> bytes | None:
+        return None
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None):
+        pass
+
+    async def delete(self, key: str):
+        pass
+
+    async def lead(self, name: str, ttl: float) -> bool:
+        return True
+
+    def stats(self) -> dict:
+        return {"backend": "local"}
+
+
+class RedisBackend:
+    """Redis-backed shared state; failures degrade to acting like a single worker."""
+
+    def __init__(self, url: str, prefix: str = "stepdaddy:"):
+        self.prefix = prefix
+        self.errors = 0
+        self.leader = False
+        self._client = redis.asyncio.from_url(url)
+        self._renew = self._client.register_script(RENEW_SCRIPT)
+        self._token = uuid.uuid4().hex
+
+    async def get(self, key: str) -> bytes | None:
+        try:
+            return await self._client.get(self.prefix + key)
+        except redis.RedisError:
+            self.errors += 1
+            return None
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None):
+        try:
+            await self._client.set(self.prefix + key, value, px=int(ttl * 1000) if ttl is not None else None)
+        except redis.RedisError:
+            self.errors += 1
+
+    async def delete(self, key: str):
+        try:
+            await self._client.delete(self.prefix + key)
+        except redis.RedisError:
+            self.errors += 1
+
+    async def lead(self, name: str, ttl: float) -> bool:
+        """Take or renew the lease ``name``; True while this worker holds it."""
+        key = f"{self.prefix}leader:{name}"
+        milliseconds = int(ttl * 1000)
+        try:
+            self.leader = bool(
+                await self._client.set(key, self._token, nx=True, px=milliseconds)
+                or await self._renew(keys=[key], args=[self._token, milliseconds])
+            )
+        except redis.RedisError:
+            # Without Redis every worker has to refresh its own copy.
+            self.errors += 1
+            self.leader = True
+        return self.leader
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "leader": self.leader, "errors": self.errors}
+
+
+def create_backend(url: str | None) -> LocalBackend | RedisBackend:
+    if url and redis is not None:
+        return RedisBackend(url)
+    return LocalBackend()
+
+
+def shared_secret(name: str, size: int) -> bytes:
+    """Return random bytes that every worker agrees on.
+
+    The first worker to ask stores them in Redis; the others read them back.
+    Called once at import, so this uses a short-lived synchronous client. A
+    Redis error is raised rather than handing this worker a secret the others
+    do not share.
+    """
+    secret = os.urandom(size)
+    if not config.redis_url or redis is None:
+        return secret
+    key = f"stepdaddy:secret:{name}"
+    client = redis.Redis.from_url(config.redis_url)
+    try:
+        client.set(key, secret, nx=True)
+        return client.get(key)
+    finally:
+        client.close()
+
+
+shared_state = create_backend(config.redis_url)
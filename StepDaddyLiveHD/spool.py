@@ -0,0 +1,115 @@
+"""On-disk spool for proxied media segments.
+
+Completed segments are written once to a file and served straight from disk,
+so caching many channels does not grow the Python heap. Segments are grouped
+into streams by the directory of their URL, and each stream keeps a ring of at
+most ``slots`` files: writing a new segment removes the stream's oldest one.
+The spool as a whole is also capped at ``max_bytes``.
+
+Each process spools into its own ``worker-<pid>`` subdirectory of the
+configured directory, so several backend workers can share one directory, and
+only that subdirectory is ever cleared.
+
+Files get a fresh name for every segment and are only ever replaced
+atomically, so a response already sending a file is never handed different
+data; removed files stay readable to anyone who still has them open.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import itertools
+import os
+import shutil
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import NamedTuple
+
+
+class SpooledSegment(NamedTuple):
+    path: Path
+    size: int
+    stream: str
+    media_type: str
+
+
+class SegmentSpool:
+    def __init__(self, directory: str, slots: int, max_bytes: int):
+        self.root = Path(directory)
+        # Set on the first write, in the process that actually serves the files.
+        self.directory: Path | None = None
+        self.slots = max(slots, 1)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.writes = 0
+        self._segments: OrderedDict[str, SpooledSegment] = OrderedDict()
+        self._streams: dict[str, deque[str]] = {}
+        self._names = itertools.count()
+        self._ready: asyncio.Task | None = None
+
+    @staticmethod
+    def stream_key(url: str) -> str:
+        return hashlib.sha256(url.rsplit("/", 1)[0].encode()).hexdigest()[:16]
+
+    def get(self, url: str) -> SpooledSegment | None:
+        return self._segments.get(url)
+
+    async def put(self, url: str, chunks: list[bytes], media_type: str) -> Path:
+        if self._ready is None:
+            self.directory = self.root / f"worker-{os.getpid()}"
+            # Files left by a previous run are not indexed, so start from an empty directory.
+            self._ready = asyncio.create_task(asyncio.to_thread(self._reset))
+        await self._ready
+        stream = self.stream_key(url)
+        path = self.directory / stream / f"{next(self._names)}.ts"
+        size = await asyncio.to_thread(self._write, path, chunks)
+        self.writes += 1
+        evicted = [self._pop(url)] if url in self._segments else []
+        self._segments[url] = SpooledSegment(path, size, stream, media_type)
+        self.size += size
+        ring = self._streams.setdefault(stream, deque())
+        ring.append(url)
+        while len(ring) > self.slots:
+            evicted.append(self._pop(ring[0]))
+        while self.size > self.max_bytes and len(self._segments) > 1:
+            evicted.append(self._pop(next(iter(self._segments))))
+        if evicted:
+            await asyncio.to_thread(self._remove, [segment.path for segment in evicted])
+        return path
+
+    def _pop(self, url: str) -> SpooledSegment:
+        segment = self._segments.pop(url)
+        self.size -= segment.size
+        ring = self._streams[segment.stream]
+        ring.remove(url)
+        if not ring:
+            del self._streams[segment.stream]
+        return segment
+
+    def _reset(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _write(path: Path, chunks: list[bytes]) -> int:
+        path.parent.mkdir(exist_ok=True)
+        temporary = path.with_name(path.name + ".tmp")
+        with open(temporary, "wb") as file:
+            file.writelines(chunks)
+        os.replace(temporary, path)
+        return sum(len(chunk) for chunk in chunks)
+
+    @staticmethod
+    def _remove(paths: list[Path]):
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {
+            "segments": len(self._segments),
+            "streams": len(self._streams),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "writes": self.writes,
+        }
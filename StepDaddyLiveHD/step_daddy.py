@@ -1,30 +1,107 @@
+import gzip
+import hashlib
 import json
 import re
+import time
 import reflex as rx
 from urllib.parse import quote, urlparse
-from curl_cffi import AsyncSession
-from typing import List
-from .utils import encrypt, decrypt, urlsafe_base64, decode_bundle
+from dataclasses import asdict, dataclass
+from email.utils import formatdate
+from typing import Dict, List, NamedTuple
+from .cache import SingleFlight, TTLCache
+from .http_pool import create_session, host_limiter, session_stats
+from .metrics import STAGE_SECONDS, count_response
+from .playlist_rewriter import PlaylistRewriter
+from .search_index import SearchIndex
+from .shared_state import shared_state
+from .utils import decrypt, urlsafe_base64, decode_bundle
 from rxconfig import config
 import html
 
 
+TARGET_DURATION_PATTERN = re.compile(r"#EXT-X-TARGETDURATION:(\d+(?:\.\d+)?)")
+CHANNEL_CARD_PATTERN = re.compile(
+    r'<a class="card"\s+href="/watch\.php\?id=(\d+)"[^>]*>\s*<div class="card__title">(.*?)</div>',
+    re.DOTALL,
+)
+
+
 class Channel(rx.Base):
     id: str
     name: str
     tags: List[str]
     logo: str | None
+    thumbnail: str | None = None
+    backdrop: str | None = None
+
+
+@dataclass(frozen=True)
+class ResolvedStream:
+    channel_key: str
+    source_url: str
+    server_key: str
+    playlist_url: str
+
+
+@dataclass(frozen=True)
+class PlaylistSnapshot:
+    body: bytes
+    gzip: bytes
+    etag: str
+    # The gzip body is a different representation, so it gets its own validator.
+    gzip_etag: str
+    last_modified: str
+
+    @classmethod
+    def render(cls, channels: List[Channel]) -> "PlaylistSnapshot":
+        lines = ["#EXTM3U"]
+        for channel in channels:
+            entry = f" tvg-logo=\"{channel.logo}\",{channel.name}" if channel.logo else f",{channel.name}"
+            lines.append(f"#EXTINF:-1{entry}\n{config.api_url}/stream/{channel.id}.m3u8")
+        lines.append("")
+        body = "\n".join(lines).encode()
+        digest = hashlib.sha1(body).hexdigest()
+        return cls(
+            body=body,
+            gzip=gzip.compress(body, compresslevel=9, mtime=0),
+            etag=f'"{digest}"',
+            gzip_etag=f'"{digest}-gzip"',
+            last_modified=formatdate(usegmt=True),
+        )
+
+
+class ChannelIndex(NamedTuple):
+    channels: List[Channel]
+    by_id: Dict[str, Channel]
+    search: SearchIndex[Channel]
+
+    @classmethod
+    def build(cls, channels: List[Channel]) -> "ChannelIndex":
+        return cls(
+            channels=channels,
+            by_id={channel.id: channel for channel in channels},
+            search=SearchIndex((channel, channel.name, channel.tags) for channel in channels),
+        )
 
 
 class StepDaddy:
     def __init__(self):
         socks5 = config.socks5
         if socks5 != "":
-            self._session = AsyncSession(proxy="socks5://" + socks5)
+            self._session = create_session(proxy="socks5://" + socks5)
         else:
-            self._session = AsyncSession()
-        self._base_url = "https://dlhd.dad"
-        self.channels = []
+            self._session = create_session()
+        self._base_url = config.dlhd_base_url.rstrip("/")
+        self._index = ChannelIndex.build([])
+        # Channels of the last refresh, keyed by the (id, raw name) card they were built from.
+        self._channels_by_card: dict[tuple[str, str], Channel] = {}
+        self._playlist_snapshot = PlaylistSnapshot.render([])
+        self._resolved = TTLCache(config.stream_cache_ttl)
+        self._playlists = TTLCache(ttl=1)
+        self._playlist_flight = SingleFlight()
+        self._keys = TTLCache(config.key_cache_ttl)
+        self._key_flight = SingleFlight()
+        self._rewriters: dict[str, PlaylistRewriter] = {}
         with open("StepDaddyLiveHD/meta.json", "r") as f:
             self._meta = json.load(f)
 
@@ -39,87 +116,247 @@ class StepDaddy:
             headers["Origin"] = origin
         return headers
 
-    async def load_channels(self):
+    async def _get(self, url: str, **kwargs):
+        async with host_limiter.slot(url):
+            try:
+                response = await self._session.get(url, **kwargs)
+            except Exception:
+                count_response(url, "error")
+                raise
+        count_response(url, response.status_code)
+        return response
+
+    @property
+    def channels(self) -> List[Channel]:
+        return self._index.channels
+
+    @channels.setter
+    def channels(self, channels: List[Channel]):
+        self._index = ChannelIndex.build(channels)
+        snapshot = PlaylistSnapshot.render(channels)
+        if snapshot.etag != self._playlist_snapshot.etag:
+            self._playlist_snapshot = snapshot
+
+    def get_channel(self, channel_id: str) -> Channel | None:
+        return self._index.by_id.get(channel_id)
+
+    def search_channels(self, query: str, tags: List[str] = ()) -> List[Channel]:
+        index = self._index
+        if not query.strip() and not tags:
+            return index.channels
+        return index.search.search(query, tags)
+
+    async def load_channels(self) -> bool:
+        """Refresh the channel list; returns whether it changed.
+
+        Channels whose id and name are unchanged keep their existing object, and
+        the index and playlist are only rebuilt when the list actually differs.
+        On failure the current list is kept.
+        """
+        response = await self._get(f"{self._base_url}/24-7-channels.php", headers=self._headers())
+        if response.status_code != 200:
+            raise ValueError("Failed to get channel list")
+        known = self._channels_by_card
+        cards = {}
         channels = []
-        try:
-            response = await self._session.get(f"{self._base_url}/24-7-channels.php", headers=self._headers())
-            matches = re.findall(
-                r'<a class="card"\s+href="/watch\.php\?id=(\d+)"[^>]*>\s*<div class="card__title">(.*?)</div>',
-                response.text,
-                re.DOTALL
-            )
-            for channel_id, channel_name in matches:
-                channel_name = html.unescape(channel_name.strip()).replace("#", "")
-                meta = self._meta.get("18+" if channel_name.startswith("18+") else channel_name, {})
-                logo = meta.get("logo", "")
-                if logo:
-                    logo = f"{config.api_url}/logo/{urlsafe_base64(logo)}"
-                channels.append(Channel(id=channel_id, name=channel_name, tags=meta.get("tags", []), logo=logo))
-        finally:
-            self.channels = sorted(channels, key=lambda channel: (channel.name.startswith("18"), channel.name))
+        for match in CHANNEL_CARD_PATTERN.finditer(response.text):
+            card = match.groups()
+            channel = cards.get(card) or known.get(card) or self._build_channel(*card)
+            cards[card] = channel
+            channels.append(channel)
+        if not channels:
+            raise ValueError("No channels found in channel list")
+        channels.sort(key=lambda channel: (channel.name.startswith("18"), channel.name))
+        self._channels_by_card = cards
+        current = self.channels
+        if len(channels) == len(current) and all(new is old for new, old in zip(channels, current)):
+            return False
+        self.channels = channels
+        return True
 
-    async def stream(self, channel_id: str):
+    def _build_channel(self, channel_id: str, channel_name: str) -> Channel:
+        channel_name = html.unescape(channel_name.strip()).replace("#", "")
+        meta = self._meta.get("18+" if channel_name.startswith("18+") else channel_name, {})
+        logo = thumbnail = backdrop = meta.get("logo", "")
+        if logo:
+            logo = f"{config.api_url}/logo/{urlsafe_base64(logo)}"
+            thumbnail = f"{logo}?variant=thumb"
+            backdrop = f"{logo}?variant=backdrop"
+        return Channel(id=channel_id, name=channel_name, tags=meta.get("tags", []), logo=logo, thumbnail=thumbnail, backdrop=backdrop)
+
+    async def publish_channels(self):
+        # The list goes first, so a worker that sees the new ETag also finds the new list.
+        await shared_state.set("channels", json.dumps([channel.dict() for channel in self.channels]).encode())
+        await shared_state.set("channels:etag", self._playlist_snapshot.etag.encode())
+
+    async def sync_channels(self) -> bool:
+        """Adopt the channel list published by the leader; returns whether it changed."""
+        etag = await shared_state.get("channels:etag")
+        if etag is None or etag.decode() == self._playlist_snapshot.etag:
+            return False
+        data = await shared_state.get("channels")
+        if data is None:
+            return False
+        self.channels = [Channel(**channel) for channel in json.loads(data)]
+        return True
+
+    async def _cached_resolution(self, channel_id: str) -> ResolvedStream | None:
+        resolved = self._resolved.get(channel_id)
+        if resolved is None:
+            data = await shared_state.get(f"resolved:{channel_id}")
+            if data is not None:
+                entry = json.loads(data)
+                ttl = entry["expires"] - time.time()
+                if ttl > 0:
+                    resolved = ResolvedStream(**entry["stream"])
+                    self._resolved.set(channel_id, resolved, ttl=ttl)
+        return resolved
+
+    async def _remember_resolution(self, channel_id: str, resolved: ResolvedStream):
+        self._resolved.set(channel_id, resolved)
+        entry = {"stream": asdict(resolved), "expires": time.time() + config.stream_cache_ttl}
+        await shared_state.set(f"resolved:{channel_id}", json.dumps(entry).encode(), ttl=config.stream_cache_ttl)
+
+    async def _forget_resolution(self, channel_id: str):
+        self._resolved.pop(channel_id)
+        await shared_state.delete(f"resolved:{channel_id}")
+
+    async def resolve(self, channel_id: str, min_remaining: float = 0) -> ResolvedStream:
+        """Return the channel's resolved stream, resolving it again when less than ``min_remaining`` seconds are left."""
+        resolved = await self._cached_resolution(channel_id)
+        if resolved is None or self._resolved.remaining(channel_id) < min_remaining:
+            resolved = await self._resolve(channel_id)
+            await self._remember_resolution(channel_id, resolved)
+        return resolved
+
+    async def _resolve(self, channel_id: str) -> ResolvedStream:
         key = "CHANNEL_KEY"
         url = f"{self._base_url}/stream/stream-{channel_id}.php"
-        response = await self._session.get(url, headers=self._headers())
+        with STAGE_SECONDS.time(stage="stream_page"):
+            response = await self._get(url, headers=self._headers())
         matches = re.compile("iframe src=\"(.*)\" width").findall(response.text)
         if matches:
             source_url = matches[0]
-            source_response = await self._session.get(source_url, headers=self._headers(url))
+            with STAGE_SECONDS.time(stage="iframe"):
+                source_response = await self._get(source_url, headers=self._headers(url))
         else:
             raise ValueError("Failed to find source URL for channel")
 
         channel_key = re.compile(rf"const\s+{re.escape(key)}\s*=\s*\"(.*?)\";").findall(source_response.text)[-1]
 
-        data = decode_bundle(source_response.text)
+        with STAGE_SECONDS.time(stage="decode_bundle"):
+            data = decode_bundle(source_response.text)
         auth_ts = data.get("b_ts", "")
         auth_sig = data.get("b_sig", "")
         auth_rnd = data.get("b_rnd", "")
         auth_url = data.get("b_host", "")
         auth_request_url = f"{auth_url}auth.php?channel_id={channel_key}&ts={auth_ts}&rnd={auth_rnd}&sig={auth_sig}"
-        auth_response = await self._session.get(auth_request_url, headers=self._headers(source_url))
+        with STAGE_SECONDS.time(stage="auth"):
+            auth_response = await self._get(auth_request_url, headers=self._headers(source_url))
         if auth_response.status_code != 200:
             raise ValueError("Failed to get auth response")
         key_url = urlparse(source_url)
         key_url = f"{key_url.scheme}://{key_url.netloc}/server_lookup.php?channel_id={channel_key}"
-        key_response = await self._session.get(key_url, headers=self._headers(source_url))
+        with STAGE_SECONDS.time(stage="server_lookup"):
+            key_response = await self._get(key_url, headers=self._headers(source_url))
         server_key = key_response.json().get("server_key")
         if not server_key:
             raise ValueError("No server key found in response")
-        if server_key == "top1/cdn":
+        if config.stream_server_url:
+            server_url = config.stream_server_url.format(server_key=server_key, channel_key=channel_key)
+        elif server_key == "top1/cdn":
             server_url = f"https://top1.newkso.ru/top1/cdn/{channel_key}/mono.m3u8"
         else:
             server_url = f"https://{server_key}new.newkso.ru/{server_key}/{channel_key}/mono.m3u8"
-        m3u8 = await self._session.get(server_url, headers=self._headers(quote(str(source_url))))
-        m3u8_data = ""
-        for line in m3u8.text.split("\n"):
-            if line.startswith("#EXT-X-KEY:"):
-                original_url = re.search(r'URI="(.*?)"', line).group(1)
-                line = line.replace(original_url, f"{config.api_url}/key/{encrypt(original_url)}/{encrypt(urlparse(source_url).netloc)}")
-            elif line.startswith("http") and config.proxy_content:
-                line = f"{config.api_url}/content/{encrypt(line)}"
-            m3u8_data += line + "\n"
+        return ResolvedStream(channel_key=channel_key, source_url=source_url, server_key=server_key, playlist_url=server_url)
+
+    async def _fetch_playlist(self, resolved: ResolvedStream):
+        with STAGE_SECONDS.time(stage="playlist"):
+            response = await self._get(resolved.playlist_url, headers=self._headers(quote(str(resolved.source_url))))
+        if response.status_code != 200:
+            raise ValueError("Failed to get stream playlist")
+        return response
+
+    async def stream(self, channel_id: str):
+        playlist = self._playlists.get(channel_id)
+        if playlist is None:
+            playlist = await self._playlist_flight.run(channel_id, self._stream, channel_id)
+        return playlist
+
+    async def upstream_playlist(self, channel_id: str):
+        """Fetch the channel's upstream media playlist, resolving the stream again if needed."""
+        resolved = await self._cached_resolution(channel_id)
+        if resolved is not None:
+            try:
+                return resolved, await self._fetch_playlist(resolved)
+            except Exception:
+                await self._forget_resolution(channel_id)
+        resolved = await self.resolve(channel_id)
+        try:
+            return resolved, await self._fetch_playlist(resolved)
+        except Exception:
+            await self._forget_resolution(channel_id)
+            raise
+
+    async def _stream(self, channel_id: str):
+        resolved, m3u8 = await self.upstream_playlist(channel_id)
+        rewriter = self._rewriters.get(channel_id)
+        if rewriter is None:
+            rewriter = self._rewriters[channel_id] = PlaylistRewriter(channel_id)
+        with STAGE_SECONDS.time(stage="rewrite"):
+            m3u8_data = rewriter.rewrite(m3u8.text, str(m3u8.url), urlparse(resolved.source_url).netloc)
+        # Serve the rewritten playlist for half a target duration so players never miss a new segment.
+        target_duration = TARGET_DURATION_PATTERN.search(m3u8.text)
+        self._playlists.set(channel_id, m3u8_data, ttl=float(target_duration.group(1)) / 2 if target_duration else None)
         return m3u8_data
 
     async def key(self, url: str, host: str):
-        url = decrypt(url)
-        host = decrypt(host)
-        response = await self._session.get(url, headers=self._headers(f"{host}/", host), timeout=60)
-        if response.status_code != 200:
-            raise Exception(f"Failed to get key")
-        return response.content
+        return await self.get_key(decrypt(url), decrypt(host))
+
+    async def get_key(self, url: str, host: str):
+        key = self._keys.get(url)
+        if key is None:
+            key = await self._key_flight.run(url, self._fetch_key, url, host)
+        return key
+
+    async def _fetch_key(self, url: str, host: str):
+        key = await shared_state.get(f"key:{url}")
+        if key is None:
+            response = await self._get(url, headers=self._headers(f"{host}/", host), timeout=60)
+            if response.status_code != 200:
+                raise Exception(f"Failed to get key")
+            key = response.content
+            await shared_state.set(f"key:{url}", key, ttl=config.key_cache_ttl)
+        self._keys.set(url, key)
+        return key
+
+    def pool_stats(self) -> dict:
+        return session_stats(self._session)
+
+    def cache_stats(self) -> dict:
+        return {
+            name: {"hits": cache.hits, "misses": cache.misses, "size": len(cache)}
+            for name, cache in (("resolved", self._resolved), ("playlists", self._playlists), ("keys", self._keys))
+        }
 
     @staticmethod
     def content_url(path: str):
         return decrypt(path)
 
-    def playlist(self):
-        data = "#EXTM3U\n"
+    def logo_urls(self) -> List[str]:
+        # Logos of listed channels first, then the rest of meta.json.
+        urls = []
         for channel in self.channels:
-            entry = f" tvg-logo=\"{channel.logo}\",{channel.name}" if channel.logo else f",{channel.name}"
-            data += f"#EXTINF:-1{entry}\n{config.api_url}/stream/{channel.id}.m3u8\n"
-        return data
+            name = "18+" if channel.name.startswith("18+") else channel.name
+            logo = self._meta.get(name, {}).get("logo")
+            if logo:
+                urls.append(logo)
+        urls.extend(meta["logo"] for meta in self._meta.values() if meta.get("logo"))
+        return list(dict.fromkeys(urls))
+
+    def playlist(self) -> PlaylistSnapshot:
+        return self._playlist_snapshot
 
     async def schedule(self):
-        response = await self._session.get(f"{self._base_url}/schedule/schedule-generated.php", headers=self._headers())
+        response = await self._get(f"{self._base_url}/schedule/schedule-generated.php", headers=self._headers())
         return response.json()
@@ -1,17 +1,25 @@
-import os
 import re
 import base64
 import json
+from collections import OrderedDict
+from functools import lru_cache
 
-key_bytes = os.urandom(64)
+from .shared_state import shared_secret
 
+# Tokens made by one backend worker have to decrypt in every other one.
+key_bytes = shared_secret("content-key", 64)
+# Repeated key used to XOR whole inputs at once; long enough for any encrypted URL.
+_key_stream = key_bytes * 64
 
+
+@lru_cache(maxsize=4096)
 def encrypt(input_string: str):
     input_bytes = input_string.encode()
     result = xor(input_bytes)
     return base64.urlsafe_b64encode(result).decode().rstrip('=')
 
 
+@lru_cache(maxsize=4096)
 def decrypt(input_string: str):
     padding_needed = 4 - (len(input_string) % 4)
     if padding_needed:
@@ -21,8 +29,19 @@ def decrypt(input_string: str):
     return result.decode()
 
 
+def cache_stats() -> dict:
+    stats = {}
+    for name, func in (("encrypt", encrypt), ("decrypt", decrypt)):
+        info = func.cache_info()
+        stats[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+    return stats
+
+
 def xor(input_bytes):
-    return bytes([input_bytes[i] ^ key_bytes[i % len(key_bytes)] for i in range(len(input_bytes))])
+    length = len(input_bytes)
+    key_stream = _key_stream if length <= len(_key_stream) else key_bytes * (length // len(key_bytes) + 1)
+    result = int.from_bytes(input_bytes, "big") ^ int.from_bytes(key_stream[:length], "big")
+    return result.to_bytes(length, "big")
 
 
 def urlsafe_base64(input_string: str) -> str:
@@ -49,31 +68,74 @@ def extract_and_decode_var(var_name: str, response: str) -> str:
     return base64.b64decode(b64).decode("utf-8")
 
 
+# The iframe usually embeds its auth bundle as JSON.parse(atob("...")); otherwise any
+# quoted base64 literal may hold it, with base64 JSON objects ("eyJ...") the likeliest.
+BUNDLE_JSON_PATTERN = re.compile(r'JSON\.parse\s*\(\s*atob\s*\(\s*["\']([^"\']{40,})["\']\s*\)\s*\)')
+BUNDLE_LITERAL_PATTERN = re.compile(r'["\']([A-Za-z0-9+/=]{40,})["\']')
+BUNDLE_KEYS = ("b_ts", "b_sig", "b_rnd", "b_host")
+_bundle_cache: OrderedDict[tuple[int, int], dict] = OrderedDict()
+
+
 def decode_bundle(response_text: str) -> dict:
-    candidates = set()
-    candidates.update(re.findall(r'JSON\.parse\s*\(\s*atob\s*\(\s*["\']([^"\']{40,})["\']\s*\)\s*\)', response_text))
-    candidates.update(re.findall(r'atob\s*\(\s*["\'](eyJ[A-Za-z0-9+/=]{40,})["\']\s*\)', response_text))
-    candidates.update(re.findall(r'(?:const|let|var)\s+[A-Za-z_$][\w$]*\s*=\s*["\'](eyJ[A-Za-z0-9+/=]{40,})["\']', response_text))
-    candidates.update(re.findall(r'["\'](eyJ[A-Za-z0-9+/=]{40,})["\']', response_text))
-    candidates.update(re.findall(r'["\']([A-Za-z0-9+/=]{80,})["\']', response_text))
-
-    for candidate in candidates:
-        try:
-            decoded_candidate = base64.b64decode(candidate).decode("utf-8")
-            data = json.loads(decoded_candidate)
-            if not all(key in data for key in ['b_ts', 'b_sig', 'b_rnd', 'b_host']):
-                continue
-            decoded = {}
-            for k, v in data.items():
-                if isinstance(v, str):
-                    try:
-                        pad = '=' * (-len(v) % 4)
-                        decoded[k] = base64.b64decode(v + pad).decode("utf-8")
-                    except Exception:
-                        decoded[k] = v
-                else:
-                    decoded[k] = v
-            return decoded
-        except Exception:
+    digest = (len(response_text), hash(response_text))
+    cached = _bundle_cache.get(digest)
+    if cached is None:
+        cached = _find_bundle(response_text)
+        _bundle_cache[digest] = cached
+        if len(_bundle_cache) > 64:
+            _bundle_cache.popitem(last=False)
+    return dict(cached)
+
+
+def _find_bundle(response_text: str) -> dict:
+    seen = set()
+    for match in BUNDLE_JSON_PATTERN.finditer(response_text):
+        candidate = match.group(1)
+        seen.add(candidate)
+        bundle = _decode_bundle_candidate(candidate)
+        if bundle is not None:
+            return bundle
+    fallback = []
+    for match in BUNDLE_LITERAL_PATTERN.finditer(response_text):
+        candidate = match.group(1)
+        if candidate in seen:
+            continue
+        seen.add(candidate)
+        if not candidate.startswith("eyJ"):
+            if len(candidate) >= 80:
+                fallback.append(candidate)
             continue
+        bundle = _decode_bundle_candidate(candidate)
+        if bundle is not None:
+            return bundle
+    for candidate in fallback:
+        bundle = _decode_bundle_candidate(candidate)
+        if bundle is not None:
+            return bundle
     return {}
+
+
+def _decode_bundle_candidate(candidate: str) -> dict | None:
+    try:
+        decoded_candidate = base64.b64decode(candidate)
+    except Exception:
+        return None
+    if b"b_sig" not in decoded_candidate:
+        return None
+    try:
+        data = json.loads(decoded_candidate.decode("utf-8"))
+    except Exception:
+        return None
+    if not isinstance(data, dict) or not all(key in data for key in BUNDLE_KEYS):
+        return None
+    decoded = {}
+    for k, v in data.items():
+        if isinstance(v, str):
+            try:
+                pad = '=' * (-len(v) % 4)
+                decoded[k] = base64.b64decode(v + pad).decode("utf-8")
+            except Exception:
+                decoded[k] = v
+        else:
+            decoded[k] = v
+    return decoded
@@ -19,6 +19,35 @@ from StepDaddyLiveHD import secret_manager
 
 proxy_content = os.environ.get("PROXY_CONTENT", "TRUE").upper() == "TRUE"
 socks5 = os.environ.get("SOCKS5", "")
+dlhd_base_url = os.environ.get("DLHD_BASE_URL", "https://dlhd.dad")
+stream_server_url = os.environ.get("STREAM_SERVER_URL", "")
+stream_cache_ttl = float(os.environ.get("STREAM_CACHE_TTL", "300"))
+segment_cache_mb = int(os.environ.get("SEGMENT_CACHE_MB", "256"))
+content_chunk_kb = int(os.environ.get("CONTENT_CHUNK_KB", "0"))
+segment_spool_dir = os.environ.get("SEGMENT_SPOOL_DIR", "")
+segment_spool_slots = int(os.environ.get("SEGMENT_SPOOL_SLOTS", "12"))
+segment_spool_mb = int(os.environ.get("SEGMENT_SPOOL_MB", "2048"))
+key_cache_ttl = float(os.environ.get("KEY_CACHE_TTL", "120"))
+upstream_max_connections = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", "100"))
+upstream_max_per_host = int(os.environ.get("UPSTREAM_MAX_PER_HOST", "20"))
+upstream_keepalive = float(os.environ.get("UPSTREAM_KEEPALIVE", "60"))
+upstream_connect_timeout = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "10"))
+upstream_read_timeout = float(os.environ.get("UPSTREAM_READ_TIMEOUT", "30"))
+logo_cache_dir = os.environ.get("LOGO_CACHE_DIR", "./logo-cache")
+logo_cache_mb = int(os.environ.get("LOGO_CACHE_MB", "200"))
+logo_prefetch_concurrency = int(os.environ.get("LOGO_PREFETCH_CONCURRENCY", "8"))
+schedule_refresh_interval = float(os.environ.get("SCHEDULE_REFRESH_INTERVAL", "600"))
+prewarm_lead_minutes = float(os.environ.get("PREWARM_LEAD_MINUTES", "10"))
+prewarm_interval = float(os.environ.get("PREWARM_INTERVAL", "60"))
+redis_url = os.environ.get("REDIS_URL") or None
+relay_mode = os.environ.get("RELAY_MODE", "FALSE").upper() == "TRUE"
+relay_idle_timeout = float(os.environ.get("RELAY_IDLE_TIMEOUT", "60"))
+if relay_mode and redis_url:
+    # Relay buffers live in the worker polling upstream, so other workers could not serve their segments.
+    # Reflex only picks a worker count when GRANIAN_WORKERS is unset.
+    os.environ.setdefault("GRANIAN_WORKERS", "1")
+    if os.environ["GRANIAN_WORKERS"] != "1":
+        raise ValueError("RELAY_MODE needs a single backend worker; unset GRANIAN_WORKERS or set it to 1.")
 playlist_secret = secret_manager.load_secret()
 
 print(f"PROXY_CONTENT: {proxy_content}\nSOCKS5: {socks5}")
@@ -27,6 +56,29 @@ config = rx.Config(
     app_name="StepDaddyLiveHD",
     proxy_content=proxy_content,
     socks5=socks5,
+    dlhd_base_url=dlhd_base_url,
+    stream_server_url=stream_server_url,
+    stream_cache_ttl=stream_cache_ttl,
+    segment_cache_mb=segment_cache_mb,
+    content_chunk_kb=content_chunk_kb,
+    segment_spool_dir=segment_spool_dir,
+    segment_spool_slots=segment_spool_slots,
+    segment_spool_mb=segment_spool_mb,
+    key_cache_ttl=key_cache_ttl,
+    upstream_max_connections=upstream_max_connections,
+    upstream_max_per_host=upstream_max_per_host,
+    upstream_keepalive=upstream_keepalive,
+    upstream_connect_timeout=upstream_connect_timeout,
+    upstream_read_timeout=upstream_read_timeout,
+    logo_cache_dir=logo_cache_dir,
+    logo_cache_mb=logo_cache_mb,
+    logo_prefetch_concurrency=logo_prefetch_concurrency,
+    schedule_refresh_interval=schedule_refresh_interval,
+    prewarm_lead_minutes=prewarm_lead_minutes,
+    prewarm_interval=prewarm_interval,
+    redis_url=redis_url,
+    relay_mode=relay_mode,
+    relay_idle_timeout=relay_idle_timeout,
     show_built_with_reflex=False,
     playlist_secret=playlist_secret,
     plugins=[
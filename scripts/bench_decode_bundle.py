@@ -0,0 +1,135 @@
+"""Benchmark ``utils.decode_bundle`` against the original extractor on generated iframe pages."""
+from __future__ import annotations
+
+import base64
+import json
+import pathlib
+import random
+import re
+import sys
+import timeit
+
+# Ensure the repository root is importable when running directly from the scripts directory.
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from StepDaddyLiveHD import utils
+
+BUNDLE_HOST = "https://top2new.newkso.ru/"
+
+
+def _b64(rng: random.Random, size: int) -> str:
+    return base64.b64encode(rng.randbytes(size)).decode("ascii")
+
+
+def _bundle(rng: random.Random) -> str:
+    fields = {
+        "b_ts": str(1760780000 + rng.randrange(10000)),
+        "b_rnd": f"{rng.getrandbits(32):08x}",
+        "b_sig": f"{rng.getrandbits(128):032x}",
+        "b_host": BUNDLE_HOST,
+    }
+    return json.dumps({key: base64.b64encode(value.encode()).decode("ascii") for key, value in fields.items()})
+
+
+def generate_page(variant: str, seed: int = 40) -> str:
+    """Build an ~86 KiB iframe page with the bundle embedded the way ``variant`` names.
+
+    The filler (style rules, inline data URIs and short base64 strings) gives the extractors the
+    same amount of near-miss text to scan as the pages they run against upstream.
+    """
+    rng = random.Random(f"{seed}:{variant}")
+    lines = ["<!DOCTYPE html>", "<html>", "<head>", '<meta charset="utf-8">', "<title>Stream</title>", "<style>"]
+    for number in range(400):
+        lines.append(
+            f".c{number}{{margin:{rng.randrange(8)}px;padding:{rng.randrange(5)}px;color:#{rng.getrandbits(24):06x}}}"
+        )
+    lines.extend(["</style>", "</head>", "<body>", "<script>"])
+    for number in range(150):
+        if number % 3 == 0:
+            lines.append(f'var img{number} = "data:image/png;base64,{_b64(rng, 600)}";')
+        elif number % 3 == 1:
+            lines.append(f'const cfg{number} = "{_b64(rng, 90)}";')
+        else:
+            lines.append(f'window.__d{number} = atob("{_b64(rng, 48)}");')
+    lines.extend(["</script>", "<script>", f'const CHANNEL_KEY = "premium{40 + rng.randrange(10)}";'])
+
+    encoded = base64.b64encode(_bundle(rng).encode()).decode("ascii")
+    if variant == "json_parse_atob":
+        lines.append(f'const _b = JSON.parse(atob("{encoded}"));')
+    elif variant == "atob_literal":
+        lines.append(f"var raw = atob('{encoded}'); var _b = JSON.parse(raw);")
+    elif variant == "const_literal":
+        lines.extend([f'const XKZK = "{encoded}";', "const _b = JSON.parse(window.atob(XKZK));"])
+    elif variant == "padded_generic":
+        # A leading space keeps the payload from starting with "eyJ", so only the generic pattern finds it.
+        padded = base64.b64encode(b" " + _bundle(rng).encode()).decode("ascii")
+        lines.append(f'window.init({{ payload: "{padded}" }});')
+    elif variant == "missing_bundle":
+        lines.append("console.log('offline');")
+    else:
+        raise ValueError(f"Unknown bundle variant: {variant}")
+
+    lines.extend(["</script>", '<div id="player"></div>'])
+    lines.extend(f'<p class="c{number}">Lorem ipsum dolor sit amet {number}</p>' for number in range(300))
+    lines.extend(["</body>", "</html>"])
+    return "\n".join(lines) + "\n"
+
+
+VARIANTS = ("atob_literal", "const_literal", "json_parse_atob", "missing_bundle", "padded_generic")
+
+
+def reference_decode_bundle(response_text: str) -> dict:
+    candidates = set()
+    candidates.update(re.findall(r'JSON\.parse\s*\(\s*atob\s*\(\s*["\']([^"\']{40,})["\']\s*\)\s*\)', response_text))
+    candidates.update(re.findall(r'atob\s*\(\s*["\'](eyJ[A-Za-z0-9+/=]{40,})["\']\s*\)', response_text))
+    candidates.update(re.findall(r'(?:const|let|var)\s+[A-Za-z_$][\w$]*\s*=\s*["\'](eyJ[A-Za-z0-9+/=]{40,})["\']', response_text))
+    candidates.update(re.findall(r'["\'](eyJ[A-Za-z0-9+/=]{40,})["\']', response_text))
+    candidates.update(re.findall(r'["\']([A-Za-z0-9+/=]{80,})["\']', response_text))
+
+    for candidate in candidates:
+        try:
+            decoded_candidate = base64.b64decode(candidate).decode("utf-8")
+            data = json.loads(decoded_candidate)
+            if not all(key in data for key in ['b_ts', 'b_sig', 'b_rnd', 'b_host']):
+                continue
+            decoded = {}
+            for k, v in data.items():
+                if isinstance(v, str):
+                    try:
+                        pad = '=' * (-len(v) % 4)
+                        decoded[k] = base64.b64decode(v + pad).decode("utf-8")
+                    except Exception:
+                        decoded[k] = v
+                else:
+                    decoded[k] = v
+            return decoded
+        except Exception:
+            continue
+    return {}
+
+
+def main() -> None:
+    number = 200
+    print(f"{'page':<24} {'KiB':>6} {'reference':>12} {'single-pass':>12} {'cached':>10} {'speedup':>8}")
+    for variant in VARIANTS:
+        text = generate_page(variant)
+        expected = reference_decode_bundle(text)
+        assert utils.decode_bundle(text) == expected, f"decode_bundle output differs for {variant}"
+        if variant != "missing_bundle":
+            assert expected.get("b_host") == BUNDLE_HOST, f"{variant} should contain a bundle"
+
+        reference = timeit.timeit(lambda: reference_decode_bundle(text), number=number) / number
+        single_pass = timeit.timeit(lambda: utils._find_bundle(text), number=number) / number
+        # Fresh copies of the page, as each upstream response arrives as a new string.
+        copies = iter([text.encode("utf-8").decode("utf-8") for _ in range(number)])
+        cached = timeit.timeit(lambda: utils.decode_bundle(next(copies)), number=number) / number
+        print(
+            f"{variant:<24} {len(text) / 1024:>6.0f} {reference * 1e3:>10.3f}ms {single_pass * 1e3:>10.3f}ms "
+            f"{cached * 1e3:>8.3f}ms {reference / single_pass:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
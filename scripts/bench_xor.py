@@ -0,0 +1,42 @@
+"""Micro-benchmark for ``utils.xor`` against the original per-byte implementation."""
+from __future__ import annotations
+
+import os
+import pathlib
+import sys
+import timeit
+
+# Ensure the repository root is importable when running directly from the scripts directory.
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from StepDaddyLiveHD import utils
+
+
+def reference_xor(input_bytes):
+    key_bytes = utils.key_bytes
+    return bytes([input_bytes[i] ^ key_bytes[i % len(key_bytes)] for i in range(len(input_bytes))])
+
+
+def main() -> None:
+    # Typical lengths: source netloc, key URI, segment URL, long signed segment URL, oversized input.
+    lengths = [24, 80, 160, 320, 1024, 8192]
+    number = 20000
+
+    for length in [0, 1, 63, 64, 65] + lengths:
+        data = os.urandom(length)
+        assert utils.xor(data) == reference_xor(data), f"xor output differs for length {length}"
+    url = "https://top1.newkso.ru/top1/cdn/premium51/2025/10/18/12/00/00-000123.ts"
+    assert utils.decrypt(utils.encrypt(url)) == url, "encrypt/decrypt should round-trip"
+
+    print(f"{'bytes':>6} {'reference':>12} {'bulk':>12} {'speedup':>8}")
+    for length in lengths:
+        data = os.urandom(length)
+        reference = timeit.timeit(lambda: reference_xor(data), number=number) / number
+        bulk = timeit.timeit(lambda: utils.xor(data), number=number) / number
+        print(f"{length:>6} {reference * 1e6:>10.2f}us {bulk * 1e6:>10.2f}us {reference / bulk:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
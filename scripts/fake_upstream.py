@@ -0,0 +1,167 @@
+"""Local stand-in for the DLHD upstream, for benchmarks and load tests.
+
+Serves everything the backend talks to: the 24/7 channel page, stream and
+iframe pages carrying an encoded auth bundle, ``auth.php``,
+``server_lookup.php``, live ``mono.m3u8`` playlists that advance with the
+clock, AES keys and synthetic segments. Every response can be delayed to mimic
+a remote site, and ``/_requests`` reports how many requests each route got.
+
+Start it and point the app at it with::
+
+    python scripts/fake_upstream.py --port 9000 --latency 0.05
+    DLHD_BASE_URL=http://127.0.0.1:9000 \\
+    STREAM_SERVER_URL='http://127.0.0.1:9000/{server_key}/{channel_key}/mono.m3u8' \\
+    reflex run
+
+``scripts/load_test.py`` does both in one process.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import time
+from collections import Counter
+from typing import Callable
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, Response
+from starlette.routing import Route
+
+
+def _b64(value: str) -> str:
+    return base64.b64encode(value.encode()).decode()
+
+
+def create_app(
+    channels: int = 50,
+    latency: float = 0.0,
+    segment_bytes: int = 512 * 1024,
+    target_duration: int = 4,
+    window: int = 6,
+) -> Callable:
+    requests: Counter[str] = Counter()
+    started = time.time()
+    # One shared payload; segments only need the right size, not real video.
+    payload = bytes(range(256)) * (segment_bytes // 256 + 1)
+
+    def base_url(request: Request) -> str:
+        return str(request.base_url).rstrip("/")
+
+    async def channel_page(request: Request):
+        cards = "\n".join(
+            f'<a class="card" href="/watch.php?id={number}"><div class="card__title">Channel {number}</div></a>'
+            for number in range(1, channels + 1)
+        )
+        return HTMLResponse(f"<html><body>{cards}</body></html>")
+
+    async def stream_page(request: Request):
+        channel_id = request.path_params["channel_id"]
+        return HTMLResponse(f'<iframe src="{base_url(request)}/premiumtv/daddy.php?id={channel_id}" width="100%"></iframe>')
+
+    async def iframe_page(request: Request):
+        channel_id = request.query_params.get("id", "0")
+        bundle = {
+            "b_ts": _b64(str(int(time.time()))),
+            "b_sig": _b64("0" * 64),
+            "b_rnd": _b64("fake"),
+            "b_host": _b64(f"{base_url(request)}/"),
+        }
+        encoded = base64.b64encode(json.dumps(bundle).encode()).decode()
+        return HTMLResponse(
+            "<html><script>\n"
+            f'const CHANNEL_KEY = "premium{channel_id}";\n'
+            f'const BUNDLE = JSON.parse(atob("{encoded}"));\n'
+            "</script></html>"
+        )
+
+    async def auth(request: Request):
+        return JSONResponse({"status": "ok"})
+
+    async def server_lookup(request: Request):
+        return JSONResponse({"server_key": "fake"})
+
+    async def playlist(request: Request):
+        server_key = request.path_params["server_key"]
+        channel_key = request.path_params["channel_key"]
+        newest = int((time.time() - started) / target_duration) + window
+        first = newest - window + 1
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{target_duration}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first}",
+        ]
+        key = None
+        for sequence in range(first, newest + 1):
+            # Keys rotate every ten segments, like the real streams.
+            if sequence // 10 != key:
+                key = sequence // 10
+                lines.append(f'#EXT-X-KEY:METHOD=AES-128,URI="/key/{channel_key}/{key}"')
+            lines.append(f"#EXTINF:{target_duration}.000,")
+            lines.append(f"/{server_key}/{channel_key}/{sequence}.ts")
+        lines.append("")
+        return Response("\n".join(lines), media_type="application/vnd.apple.mpegurl")
+
+    async def key(request: Request):
+        return Response(f"{request.path_params['channel_key']}:{request.path_params['key']}".encode().ljust(16, b"\0")[:16])
+
+    async def segment(request: Request):
+        return Response(payload[:segment_bytes], media_type="video/mp2t")
+
+    async def schedule(request: Request):
+        return JSONResponse({})
+
+    async def request_counts(request: Request):
+        return JSONResponse(dict(requests))
+
+    app = Starlette(routes=[
+        Route("/24-7-channels.php", channel_page),
+        Route("/stream/stream-{channel_id}.php", stream_page),
+        Route("/premiumtv/daddy.php", iframe_page),
+        Route("/auth.php", auth),
+        Route("/server_lookup.php", server_lookup),
+        Route("/schedule/schedule-generated.php", schedule),
+        Route("/key/{channel_key}/{key}", key),
+        Route("/_requests", request_counts),
+        Route("/{server_key}/{channel_key}/mono.m3u8", playlist),
+        Route("/{server_key}/{channel_key}/{sequence:int}.ts", segment),
+    ])
+
+    async def count_and_delay(scope, receive, send):
+        if scope["type"] == "http":
+            route = scope["path"]
+            for match in ("/stream/", "/key/", "/mono.m3u8", ".ts"):
+                if match in route:
+                    route = match
+                    break
+            if route != "/_requests":
+                requests[route] += 1
+                if latency:
+                    await asyncio.sleep(latency)
+        await app(scope, receive, send)
+
+    count_and_delay.requests = requests
+    return count_and_delay
+
+
+def main():
+    from granian.constants import Interfaces
+    from granian.server.embed import Server
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--segment-kb", type=int, default=512)
+    parser.add_argument("--target-duration", type=int, default=4)
+    args = parser.parse_args()
+    app = create_app(args.channels, args.latency, args.segment_kb * 1024, args.target_duration)
+    asyncio.run(Server(app, address=args.host, port=args.port, interface=Interfaces.ASGI, log_enabled=False).serve())
+
+
+if __name__ == "__main__":
+    main()
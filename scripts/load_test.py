@@ -0,0 +1,166 @@
+"""Simulate concurrent HLS players against ``backend.fastapi_app`` and a fake upstream.
+
+Starts ``fake_upstream`` on a local port, points the backend at it and runs
+``--players`` players spread over ``--channels`` channels for ``--duration``
+seconds. Each player reloads its playlist once per target duration and
+downloads every new key and segment once, like a real player. The report lists
+throughput, p50/p99 latency per request kind and upstream amplification:
+upstream requests per request served to players.
+
+Example::
+
+    python scripts/load_test.py --players 200 --channels 10 --duration 30 --latency 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import pathlib
+import sys
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+# Ensure the repository root is importable when running directly from the scripts directory.
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+# Upstream requests that serve each kind of player request.
+UPSTREAM_ROUTES = {"playlist": ("/mono.m3u8",), "key": ("/key/",), "segment": (".ts",)}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--channels", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run the players for")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the fake upstream adds to every response")
+    parser.add_argument("--segment-kb", type=int, default=256)
+    parser.add_argument("--target-duration", type=int, default=2)
+    parser.add_argument("--port", type=int, default=9123, help="port for the fake upstream")
+    parser.add_argument("--relay", action="store_true", help="run the backend in relay mode")
+    parser.add_argument("--spool", metavar="DIR", help="spool segments to this directory")
+    return parser.parse_args()
+
+
+def configure(args: argparse.Namespace):
+    # rxconfig reads the environment once at import, so this has to run before the backend is imported.
+    upstream = f"http://127.0.0.1:{args.port}"
+    os.environ["DLHD_BASE_URL"] = upstream
+    os.environ["STREAM_SERVER_URL"] = upstream + "/{server_key}/{channel_key}/mono.m3u8"
+    os.environ["PROXY_CONTENT"] = "TRUE"
+    os.environ["RELAY_MODE"] = "TRUE" if args.relay else "FALSE"
+    os.environ["SEGMENT_SPOOL_DIR"] = args.spool or ""
+    os.environ.setdefault("PREWARM_LEAD_MINUTES", "0")
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def local_path(url: str) -> str:
+    parts = urlsplit(url)
+    return parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+async def run(args: argparse.Namespace):
+    import httpx
+    from granian.constants import Interfaces
+    from granian.server.embed import Server
+
+    from fake_upstream import create_app
+    from StepDaddyLiveHD import backend
+    from StepDaddyLiveHD.playlist_rewriter import URI_PATTERN
+
+    upstream = create_app(args.channels, args.latency, args.segment_kb * 1024, args.target_duration)
+    server = Server(upstream, address="127.0.0.1", port=args.port, interface=Interfaces.ASGI, log_enabled=False)
+    server_task = asyncio.create_task(server.serve())
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(f"http://127.0.0.1:{args.port}/_requests")
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.05)
+    await backend.step_daddy.load_channels()
+    before = Counter(upstream.requests)
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: Counter[str] = Counter()
+    received = 0
+    deadline = time.monotonic() + args.duration
+
+    async def fetch(client: httpx.AsyncClient, kind: str, path: str) -> httpx.Response | None:
+        nonlocal received
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+        except Exception:
+            errors[kind] += 1
+            return None
+        latencies[kind].append(time.perf_counter() - started)
+        if response.status_code != 200:
+            errors[kind] += 1
+            return None
+        received += len(response.content)
+        return response
+
+    async def player(client: httpx.AsyncClient, number: int):
+        channel_id = str(number % args.channels + 1)
+        await asyncio.sleep(number / args.players)
+        seen = None
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            response = await fetch(client, "playlist", f"/stream/{channel_id}.m3u8")
+            if response is not None:
+                keys, segments = [], []
+                for line in response.text.splitlines():
+                    match = URI_PATTERN.search(line) if line.startswith("#EXT-X-KEY:") else None
+                    if match:
+                        keys.append(match.group(1))
+                    elif line and not line.startswith("#"):
+                        segments.append(line)
+                if seen is None:
+                    # Players join three segments behind live.
+                    seen = set(segments[:-3])
+                for url in dict.fromkeys(keys + segments):
+                    if url not in seen:
+                        seen.add(url)
+                        await fetch(client, "key" if url in keys else "segment", local_path(url))
+            await asyncio.sleep(max(args.target_duration - (time.monotonic() - started), 0.1))
+
+    started = time.monotonic()
+    transport = httpx.ASGITransport(app=backend.fastapi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=60) as client:
+        await asyncio.gather(*(player(client, number) for number in range(args.players)))
+    elapsed = time.monotonic() - started
+
+    upstream_requests = Counter(upstream.requests)
+    upstream_requests.subtract(before)
+    server.stop()
+    await server_task
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"players={args.players} channels={args.channels} duration={elapsed:.1f}s relay={args.relay} spool={bool(args.spool)}")
+    print(f"throughput: {total / elapsed:.1f} req/s, {received / elapsed / 1024 / 1024:.2f} MiB/s")
+    print(f"{'kind':<10}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'upstream':>10}{'amplif.':>10}")
+    for kind in ("playlist", "key", "segment"):
+        values = latencies[kind]
+        upstream_count = sum(count for route, count in upstream_requests.items() if route in UPSTREAM_ROUTES[kind])
+        amplification = upstream_count / len(values) if values else 0.0
+        print(
+            f"{kind:<10}{len(values):>10}{errors[kind]:>8}{percentile(values, 0.5) * 1000:>10.1f}"
+            f"{percentile(values, 0.99) * 1000:>10.1f}{upstream_count:>10}{amplification:>10.3f}"
+        )
+    print(f"stream resolutions: {upstream_requests['/stream/']}")
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    configure(arguments)
+    asyncio.run(run(arguments))
@@ -0,0 +1,83 @@
+"""Checks for byte ranges and upstream errors on the ``/content`` proxy."""
+from __future__ import annotations
+
+import pathlib
+import sys
+from contextlib import asynccontextmanager
+
+# Ensure the repository root is importable when running directly from the scripts directory.
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import httpx
+from fastapi.testclient import TestClient
+
+from StepDaddyLiveHD import backend
+from StepDaddyLiveHD.backend import _byte_range, fastapi_app
+from StepDaddyLiveHD.utils import encrypt
+
+
+PAYLOAD = bytes(range(200)) * 5
+
+
+class FakeResponse:
+    headers = {"content-type": "video/mp2t", "content-length": str(len(PAYLOAD))}
+
+    async def aiter_raw(self, chunk_size: int | None = None):
+        for start in range(0, len(PAYLOAD), 300):
+            yield PAYLOAD[start:start + 300]
+
+
+@asynccontextmanager
+async def fake_fetch(url: str):
+    if url.endswith("/forbidden.ts"):
+        request = httpx.Request("GET", url)
+        raise httpx.HTTPStatusError("Forbidden", request=request, response=httpx.Response(403, request=request))
+    yield FakeResponse()
+
+
+def check_byte_range() -> None:
+    assert _byte_range("bytes=0-99", 1000) == (0, 100), "Both ends of a range are inclusive."
+    assert _byte_range("bytes=900-", 1000) == (900, 1000), "Open ranges run to the end."
+    assert _byte_range("bytes=-100", 1000) == (900, 1000), "Suffix ranges count from the end."
+    assert _byte_range("bytes=-5000", 1000) == (0, 1000), "Long suffix ranges cover the whole body."
+    assert _byte_range("bytes=990-2000", 1000) == (990, 1000), "Ranges are clamped to the body."
+    assert _byte_range("bytes=1000-", 1000) == (1000, 1000), "Ranges past the end are not satisfiable."
+    assert _byte_range("bytes=-0", 1000) == (1000, 1000), "Empty suffix ranges are not satisfiable."
+    for ignored in ("items=0-1", "bytes=0-1,5-6", "bytes=a-b", "bytes=5-1"):
+        assert _byte_range(ignored, 1000) is None, f"{ignored!r} should be ignored."
+
+
+def check_content() -> None:
+    backend.segment_cache._fetch = fake_fetch
+    path = f"/content/{encrypt('https://cdn.example/1/1.ts')}"
+    with TestClient(fastapi_app) as client:
+        full = client.get(path)
+        assert full.status_code == 200 and full.content == PAYLOAD, "Whole segments should be proxied unchanged."
+        assert full.headers["content-length"] == str(len(PAYLOAD)) and full.headers["accept-ranges"] == "bytes"
+
+        partial = client.get(path, headers={"Range": "bytes=250-649"})
+        assert partial.status_code == 206 and partial.content == PAYLOAD[250:650], "Ranges should be served."
+        assert partial.headers["content-range"] == f"bytes 250-649/{len(PAYLOAD)}"
+        assert partial.headers["content-length"] == "400"
+
+        suffix = client.get(path, headers={"Range": "bytes=-10"})
+        assert suffix.status_code == 206 and suffix.content == PAYLOAD[-10:], "Suffix ranges should be served."
+
+        beyond = client.get(path, headers={"Range": f"bytes={len(PAYLOAD)}-"})
+        assert beyond.status_code == 416, "Ranges past the end should be refused."
+        assert beyond.headers["content-range"] == f"bytes */{len(PAYLOAD)}"
+
+        forbidden = client.get(f"/content/{encrypt('https://cdn.example/1/forbidden.ts')}")
+        assert forbidden.status_code == 403, "Upstream errors should keep their status code."
+
+
+def main() -> None:
+    check_byte_range()
+    check_content()
+    print("Content range checks passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Checks for rewriting upstream media playlists through the proxy."""
+from __future__ import annotations
+
+import pathlib
+import sys
+
+# Ensure the repository root is importable when running directly from the scripts directory.
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from rxconfig import config
+from StepDaddyLiveHD.playlist_rewriter import PlaylistRewriter
+from StepDaddyLiveHD.utils import decrypt, encrypt
+
+
+BASE_URL = "https://cdn.example/premium1/mono.m3u8"
+HOST = "https://source.example"
+
+
+def window(first: int) -> str:
+    lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:4", f"#EXT-X-MEDIA-SEQUENCE:{first}"]
+    lines.append('#EXT-X-KEY:METHOD=AES-128,URI="/key/premium1/7",IV=0x01')
+    for sequence in range(first, first + 3):
+        lines.extend(["#EXTINF:4.000,", f"{sequence}.ts"])
+    return "\n".join(lines)
+
+
+def main() -> None:
+    config.proxy_content = True
+    rewriter = PlaylistRewriter("1")
+    output = rewriter.rewrite(window(10), BASE_URL, HOST)
+    lines = output.split("\n")
+
+    assert lines[:3] == ["#EXTM3U", "#EXT-X-TARGETDURATION:4", "#EXT-X-MEDIA-SEQUENCE:10"], "Tags should be kept."
+    key_line = lines[3]
+    expected_key = f'URI="{config.api_url}/key/{encrypt("https://cdn.example/key/premium1/7")}/{encrypt(HOST)}"'
+    assert expected_key in key_line and key_line.endswith(",IV=0x01"), "Key URIs should point at the key endpoint."
+    segment = lines[5]
+    prefix = f"{config.api_url}/content/"
+    assert segment.startswith(prefix) and segment.endswith("?channel=1"), "Segments should go through /content."
+    assert decrypt(segment[len(prefix):-len("?channel=1")]) == "https://cdn.example/premium1/10.ts", (
+        "Relative segment URLs should resolve against the playlist URL."
+    )
+    assert output.endswith("\n"), "The playlist should end with a newline."
+
+    # Lines carried over from the previous window are reused; the result must match a fresh rewrite.
+    slid = rewriter.rewrite(window(11), BASE_URL, HOST)
+    assert slid == PlaylistRewriter("1").rewrite(window(11), BASE_URL, HOST), "Reused lines should not change output."
+
+    moved = rewriter.rewrite(window(11), "https://other.example/premium1/mono.m3u8", HOST)
+    assert "https://other.example/premium1/11.ts" in [
+        decrypt(line[len(prefix):-len("?channel=1")]) for line in moved.split("\n") if line.startswith(prefix)
+    ], "A new base URL should not reuse lines rewritten for the old one."
+
+    mapped = PlaylistRewriter().rewrite('#EXT-X-MAP:URI="init.mp4"', BASE_URL, HOST)
+    assert mapped == f'#EXT-X-MAP:URI="{prefix}{encrypt("https://cdn.example/premium1/init.mp4")}"\n', (
+        "Init segments should be proxied, without a channel label when none is given."
+    )
+
+    config.proxy_content = False
+    direct = PlaylistRewriter("1").rewrite(window(10), BASE_URL, HOST)
+    assert "https://cdn.example/premium1/10.ts" in direct.split("\n"), "Without proxying, segments go straight upstream."
+
+    print("Playlist rewriter checks passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Checks for the live relay's first playlist and segment buffer."""
+from __future__ import annotations
+
+import asyncio
+import pathlib
+import sys
+from types import SimpleNamespace
+
+# Ensure the repository root is importable when running directly from the scripts directory.
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from StepDaddyLiveHD.relay import RelayManager
+
+
+UPSTREAM_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:4
+#EXT-X-MEDIA-SEQUENCE:10
+#EXT-X-KEY:METHOD=AES-128,URI="https://keys.example/key/1"
+#EXTINF:4.000,
+10.ts
+#EXTINF:4.000,
+11.ts
+"""
+
+
+class FakeStepDaddy:
+    def __init__(self):
+        self.keys = []
+
+    async def upstream_playlist(self, channel_id: str):
+        resolved = SimpleNamespace(source_url="https://source.example/")
+        m3u8 = SimpleNamespace(text=UPSTREAM_PLAYLIST, url=f"https://cdn.example/{channel_id}/mono.m3u8")
+        return resolved, m3u8
+
+    async def get_key(self, url: str, host: str) -> bytes:
+        self.keys.append(url)
+        return b"0" * 16
+
+
+async def failing_segments() -> None:
+    async def fetch(url: str) -> bytes:
+        raise ConnectionError(f"upstream refused {url}")
+
+    manager = RelayManager(FakeStepDaddy(), fetch, idle_timeout=60)
+    try:
+        await asyncio.wait_for(manager.playlist("1"), timeout=5)
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("The first playlist should fail when no segment could be fetched.")
+    assert not manager.stats(), "A relay whose first poll failed should not keep running."
+    manager.stop()
+
+
+async def relayed_segments() -> None:
+    fetched = []
+
+    async def fetch(url: str) -> bytes:
+        fetched.append(url)
+        return url.encode()
+
+    step_daddy = FakeStepDaddy()
+    manager = RelayManager(step_daddy, fetch, idle_timeout=60)
+    try:
+        playlist = await asyncio.wait_for(manager.playlist("1"), timeout=5)
+        again = await manager.playlist("1")
+        buffered = manager.segment("1", 10)
+        missing = manager.segment("1", 12)
+    finally:
+        manager.stop()
+    assert playlist == again, "Viewers should share the relay's current playlist."
+    assert "#EXT-X-MEDIA-SEQUENCE:10" in playlist, "The relay should keep upstream sequence numbers."
+    assert "/relay/1/10.ts" in playlist and "/relay/1/11.ts" in playlist, "Segments should point at the relay."
+    assert "keys.example" not in playlist, "Keys should be rewritten to the local key endpoint."
+    assert fetched == ["https://cdn.example/1/10.ts", "https://cdn.example/1/11.ts"], "Each segment is fetched once."
+    assert step_daddy.keys == ["https://keys.example/key/1"], "Each key is fetched once."
+    assert buffered == b"https://cdn.example/1/10.ts", "Buffered segments should be served."
+    assert missing is None, "Unknown segments should not be served."
+
+
+def main() -> None:
+    asyncio.run(failing_segments())
+    asyncio.run(relayed_segments())
+    print("Relay checks passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Checks for channel and event search."""
+from __future__ import annotations
+
+import pathlib
+import sys
+
+# Ensure the repository root is importable when running directly from the scripts directory.
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from StepDaddyLiveHD.schedule_store import category_tag, parse_schedule
+from StepDaddyLiveHD.search_index import SearchIndex, normalize
+
+
+DOCUMENTS = [
+    ("1", "Sky Sports Main Event", ["#sports", "🇬🇧"]),
+    ("2", "ESPN", ["#sports", "🇺🇸"]),
+    ("3", "Canal+ Sport", ["#sports", "🇫🇷"]),
+    ("4", "Sports", []),
+    ("5", "Télé Monte Carlo", ["🇫🇷"]),
+    ("6", "BBC One", ["🇬🇧"]),
+    ("7", "Eurosport 1", ["#sports"]),
+]
+
+
+def main() -> None:
+    index = SearchIndex(DOCUMENTS)
+    assert len(index) == len(DOCUMENTS)
+
+    assert normalize("  Télé   MONTE ") == "tele monte", "Names should be case-folded, unaccented and collapsed."
+    assert index.search("") == [key for key, _, _ in DOCUMENTS], "An empty query should keep the original order."
+
+    # Exact name, then prefix, then word prefix, then any substring; ties keep document order.
+    assert index.search("sports") == ["4", "1"], "An exact name should rank before a word match."
+    assert index.search("SPORT") == ["4", "1", "3", "7"], "Prefix, then word prefixes in order, then substrings."
+    assert index.search("tele") == ["5"], "Accents should not matter."
+    assert index.search("main event") == ["1"], "Every query word has to match."
+    assert index.search("event main") == ["1"], "Word order should not matter."
+    assert index.search("xyz") == [], "Unknown words should match nothing."
+
+    assert index.search("#sports") == ["1", "2", "3", "7"], "Tag words should filter by tag."
+    assert index.search("#sports sky") == ["1"], "Tags and words should combine."
+    assert index.search("", ["🇫🇷"]) == ["3", "5"], "Explicit tags should filter too."
+    assert index.search("one", ["🇫🇷"]) == [], "Explicit tags should narrow name matches."
+    assert index.search("sp") == ["4", "1", "3", "2", "7"], "Words shorter than a trigram should still match."
+
+    schedule = parse_schedule({
+        "Saturday 18th Oct 2025 - Schedule Time UK GMT": {
+            "Am. Football": [{"time": "18:00", "event": "Bears vs Packers", "channels": []}],
+            "Soccer": [{"time": "15:00", "event": "Green Bay Packers FC", "channels": []}],
+        },
+    })
+    assert category_tag("Am. Football") == "#amfootball", "Category tags should be single lowercase words."
+    football = schedule.index.search("packers #amfootball")
+    assert len(football) == 1 and "|Am. Football|" in football[0], "Events should be filterable by category tag."
+    assert len(schedule.index.search("packers")) == 2, "Without a tag every matching event is found."
+
+    print("Search index checks passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Checks for the shared segment cache: single-flight downloads, tailing, ranges, abandonment and spooling."""
+from __future__ import annotations
+
+import asyncio
+import pathlib
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+
+# Ensure the repository root is importable when running directly from the scripts directory.
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from StepDaddyLiveHD.segment_cache import SegmentCache
+from StepDaddyLiveHD.spool import SegmentSpool
+
+
+CHUNKS = [b"aaaa", b"bbbb", b"cccc"]
+PAYLOAD = b"".join(CHUNKS)
+
+
+class FakeResponse:
+    def __init__(self, upstream: FakeUpstream, headers: dict):
+        self.headers = headers
+        self._upstream = upstream
+
+    async def _chunks(self):
+        for chunk in CHUNKS:
+            # Each chunk waits for the test to release it, so requests can join mid-download.
+            await self._upstream.release.get()
+            yield chunk
+
+    def aiter_raw(self, chunk_size: int | None = None):
+        return self._chunks()
+
+    def aiter_bytes(self, chunk_size: int | None = None):
+        return self._chunks()
+
+
+class FakeUpstream:
+    def __init__(self, headers: dict | None = None):
+        self.headers = {"content-type": "video/mp2t", "content-length": str(len(PAYLOAD))} if headers is None else headers
+        self.requests = 0
+        self.closed = 0
+        self.release: asyncio.Queue[None] = asyncio.Queue()
+
+    def send_all(self):
+        for _ in CHUNKS:
+            self.release.put_nowait(None)
+
+    @asynccontextmanager
+    async def fetch(self, url: str):
+        self.requests += 1
+        try:
+            yield FakeResponse(self, self.headers)
+        finally:
+            self.closed += 1
+
+
+async def read(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+async def single_flight() -> None:
+    upstream = FakeUpstream()
+    cache = SegmentCache(upstream.fetch, max_bytes=1024)
+    first = await cache.get("https://cdn.example/1.ts")
+    assert first.length == len(PAYLOAD) and first.media_type == "video/mp2t", "Headers should be known once ready."
+    upstream.release.put_nowait(None)
+    early = asyncio.create_task(read(first.reader()))
+    await asyncio.sleep(0)
+    # A second request joins the download that is already running.
+    second = await cache.get("https://cdn.example/1.ts")
+    assert second is first, "Concurrent requests should share one in-flight segment."
+    late = asyncio.create_task(read(second.reader()))
+    upstream.release.put_nowait(None)
+    upstream.release.put_nowait(None)
+    assert await early == PAYLOAD and await late == PAYLOAD, "Every reader should get the whole segment."
+    assert upstream.requests == 1, "Only one upstream request should be made."
+    third = await cache.get("https://cdn.example/1.ts")
+    assert await read(third.reader()) == PAYLOAD, "Completed segments should be served from memory."
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, 1, 1), f"Unexpected counters: {stats}"
+
+
+async def ranges() -> None:
+    upstream = FakeUpstream()
+    upstream.send_all()
+    cache = SegmentCache(upstream.fetch, max_bytes=1024)
+    segment = await cache.get("https://cdn.example/2.ts")
+    assert await read(segment.reader(2, 10)) == PAYLOAD[2:10], "Ranges across chunk boundaries should be sliced."
+    assert await read(segment.reader(4, 8)) == PAYLOAD[4:8], "Ranges on chunk boundaries should be exact."
+    assert await read(segment.reader(9)) == PAYLOAD[9:], "Open-ended ranges should run to the end."
+
+    # Partial ranges finishing while the download is still running must not abandon it.
+    upstream = FakeUpstream()
+    cache = SegmentCache(upstream.fetch, max_bytes=1024)
+    for number, chunk in enumerate(CHUNKS):
+        upstream.release.put_nowait(None)
+        segment = await cache.get("https://cdn.example/3.ts")
+        start = number * len(chunk)
+        assert await read(segment.reader(start, start + len(chunk))) == chunk, "Each range should get its bytes."
+        await asyncio.sleep(0)
+    assert upstream.requests == 1 and not cache.stats()["abandoned"], "Ranges should share one upstream download."
+    assert cache.stats()["segments"] == 1, "The segment should be cached once complete."
+
+
+async def abandonment() -> None:
+    upstream = FakeUpstream()
+    cache = SegmentCache(upstream.fetch, max_bytes=1024)
+    segment = await cache.get("https://cdn.example/3.ts")
+    upstream.release.put_nowait(None)
+    reader = segment.reader()
+    assert await reader.__anext__() == CHUNKS[0]
+    # The only viewer disconnects halfway through.
+    await reader.aclose()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert upstream.closed == 1, "The upstream response should be closed once nobody reads the segment."
+    assert cache.stats()["abandoned"] == 1 and not cache.stats()["inflight"], "The download should be dropped."
+    upstream.send_all()
+    again = await cache.get("https://cdn.example/3.ts")
+    assert again is not segment and await read(again.reader()) == PAYLOAD, "A later request should download afresh."
+    assert upstream.requests == 2
+
+
+async def eviction_and_encoding() -> None:
+    upstream = FakeUpstream()
+    cache = SegmentCache(upstream.fetch, max_bytes=len(PAYLOAD) * 2)
+    for number in range(3):
+        upstream.send_all()
+        await read((await cache.get(f"https://cdn.example/{number}.ts")).reader())
+    assert cache.stats()["segments"] == 2 and cache.size == len(PAYLOAD) * 2, "Least recently used segments should go."
+
+    encoded = FakeUpstream({"content-type": "video/mp2t", "content-length": "5", "content-encoding": "gzip"})
+    cache = SegmentCache(encoded.fetch, max_bytes=1024)
+    segment = await cache.get("https://cdn.example/gzip.ts")
+    assert segment.length is None, "A decoded body should not claim the encoded length."
+    encoded.send_all()
+    await read(segment.reader())
+    assert segment.length == len(PAYLOAD), "The length should be known once the download finished."
+
+
+async def spooling() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        upstream = FakeUpstream()
+        upstream.send_all()
+        spool = SegmentSpool(directory, slots=4, max_bytes=1024)
+        cache = SegmentCache(upstream.fetch, max_bytes=1024, spool=spool)
+        await read((await cache.get("https://cdn.example/4.ts")).reader())
+        for _ in range(10):
+            if cache.spooled("https://cdn.example/4.ts") is not None:
+                break
+            await asyncio.sleep(0.01)
+        spooled = cache.spooled("https://cdn.example/4.ts")
+        assert spooled is not None and spooled.path.read_bytes() == PAYLOAD, "Completed segments should be spooled."
+        assert not cache.stats()["segments"], "Spooled segments should not also be kept in memory."
+
+    class BrokenSpool(SegmentSpool):
+        async def put(self, url, chunks, media_type):
+            raise OSError("disk full")
+
+    upstream = FakeUpstream()
+    upstream.send_all()
+    cache = SegmentCache(upstream.fetch, max_bytes=1024, spool=BrokenSpool("unused", slots=1, max_bytes=0))
+    await read((await cache.get("https://cdn.example/5.ts")).reader())
+    await asyncio.sleep(0)
+    assert cache.stats()["segments"] == 1, "A failing spool should fall back to the memory cache."
+
+
+def main() -> None:
+    for check in (single_flight, ranges, abandonment, eviction_and_encoding, spooling):
+        asyncio.run(asyncio.wait_for(check(), timeout=5))
+    print("Segment cache checks passed.")
+
+
+if __name__ == "__main__":
+    main()